@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import sys, time, subprocess
+import numpy as np
+import cv2
+from framesource import open_frame_source
+from functions import cropFrame, stretchFrame, laplacianImage, extractDroplets
+from segmenter import DropletSegmenter
+
+def readFrames(inputfolder, cutTop=40, cutBottom=-60):
+    '''
+    Read the cropped grayscale frames of a folder, TIFF stack or video into
+    memory, so that decoding is not part of the timings.
+    '''
+    with open_frame_source(inputfolder) as source:
+        return np.stack([cv2.cvtColor(cropFrame(source[im], cutTop, cutBottom),
+                                      cv2.COLOR_BGR2GRAY) for im in range(len(source))])
+
+def timeit(function, repeats=5):
+    '''
+    Smallest time of a number of calls of function, in seconds.
+    '''
+    best = np.inf
+    for r in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def laplacians(frames):
+    '''
+    Laplacian images of the frames, one frame at a time.
+    '''
+    return [laplacianImage(stretchFrame(img1)) for img1 in frames]
+
+def segmentFrames(segmenter, frames):
+    '''
+    Segment all frames, the number of droplets found.
+    '''
+    return sum(len(segmenter.segmentFrame(img1, 'frame')[0]) for img1 in frames)
+
+def benchmark(inputfolder, repeats=5):
+    '''
+    Time the edge filter alone and the full segmentation of every frame.
+
+    Parameters
+    ----------
+    inputfolder : Path
+        The folder, TIFF stack or video with the frames.
+    repeats : integer, optional
+        The fastest of this number of runs is reported.
+
+    Returns
+    -------
+    None.
+
+    '''
+    frames = readFrames(inputfolder)
+    n = len(frames)
+    print('%d frames of %dx%d pixels, %d OpenCV threads'%(n, frames.shape[2], frames.shape[1],
+                                                          cv2.getNumThreads()))
+    segmenter = DropletSegmenter({}, verbose=False)
+    edges = timeit(lambda: laplacians(frames), repeats)
+    full = timeit(lambda: segmentFrames(segmenter, frames), repeats)
+    print('%-14s %10.2f'%('edges ms/fr', 1000*edges/n))
+    print('%-14s %10.2f'%('segment ms/fr', 1000*full/n))
+
+def extractAll(masks, precision, epsilon):
+    '''
+    The droplets of all droplet masks with the given feature precision.
+    '''
+    return [extractDroplets(mask.copy(), 'frame', 5000, 40, precision, epsilon)[0] for mask in masks]
+
+def featureModes(inputfolder, epsilons=(0.5, 1, 2), repeats=5):
+    '''
+    Compare the droplet features of the fast precision mode with the full
+    contours, the time of the droplet extraction and the relative error of
+    every feature.
+
+    Parameters
+    ----------
+    inputfolder : Path
+        The folder, TIFF stack or video with the frames.
+    epsilons : list, optional
+        The contour tolerances of the fast mode to measure.
+    repeats : integer, optional
+        The fastest of this number of runs is reported.
+
+    Returns
+    -------
+    None.
+
+    '''
+    frames = readFrames(inputfolder)
+    segmenter = DropletSegmenter({}, verbose=False)
+    masks = [segmenter.segmentFrame(img1, 'frame')[1] for img1 in frames]
+    full = extractAll(masks, 'full', 1)
+    n = sum(len(drops) for drops in full)
+    features = ['area', 'rMean', 'rMed', 'rStd', 'majorAxis', 'minorAxis']
+    print('%d frames, %d droplets, relative error in %% as mean/max'%(len(frames), n))
+    print('%-10s %8s %9s '%('mode', 'ms/drop', 'droplets') + ' '.join('%13s'%f for f in features))
+    t = timeit(lambda: extractAll(masks, 'full', 1), repeats)
+    print('%-10s %8.3f %9d'%('full', 1000*t/max(n, 1), n))
+    for epsilon in epsilons:
+        t = timeit(lambda: extractAll(masks, 'fast', epsilon), repeats)
+        fast = extractAll(masks, 'fast', epsilon)
+        errors = {f: [] for f in features}
+        for drops, fastdrops in zip(full, fast):
+            for drop in drops:
+                # the droplet of the fast mode with the closest center
+                match = min(fastdrops, key=lambda d: (int(d.positionX) - int(drop.positionX))**2 +
+                                                     (int(d.positionY) - int(drop.positionY))**2,
+                            default=None)
+                if match is None:
+                    continue
+                for f in features:
+                    errors[f].append(abs(getattr(match, f)/getattr(drop, f) - 1))
+        print('%-10s %8.3f %9d '%('fast %g'%epsilon, 1000*t/max(n, 1),
+                                  sum(len(drops) for drops in fast)) +
+              ' '.join('%6.2f/%6.2f'%(100*np.mean(errors[f]), 100*np.max(errors[f]))
+                       if errors[f] else '%13s'%'' for f in features))
+
+def startupTime(command, repeats=5):
+    '''
+    Smallest wall time of a number of runs of a command in a new Python
+    process, in seconds.
+    '''
+    return timeit(lambda: subprocess.run([sys.executable] + command, check=True,
+                                         stdout=subprocess.DEVNULL), repeats)
+
+def startup(parameterfile=None, repeats=5):
+    '''
+    Measure the startup time of the command line tool and the import time
+    of the modules it depends on, each in a fresh interpreter.
+
+    Parameters
+    ----------
+    parameterfile : Path, optional
+        A parameter file to time the --validate dry run with.
+    repeats : integer, optional
+        The fastest of this number of runs is reported.
+
+    Returns
+    -------
+    None.
+
+    '''
+    commands = [('python', ['-c', 'pass']),
+                ('--help', ['droplet_segmentation.py', '--help'])]
+    if parameterfile is not None:
+        commands.append(('--validate', ['droplet_segmentation.py', '--validate', str(parameterfile)]))
+    for module in ['numpy', 'cv2', 'skimage', 'tifffile', 'functions', 'segmenter']:
+        commands.append(('import ' + module, ['-c', 'import ' + module]))
+    print('%-20s %10s'%('command', 'ms'))
+    for name, command in commands:
+        try:
+            print('%-20s %10.1f'%(name, 1000*startupTime(command, repeats)))
+        except subprocess.CalledProcessError:
+            print('%-20s %10s'%(name, 'failed'))
+
+def main():
+    '''
+    Time the segmentation of a folder of frames:
+    > python benchmark.py /input_directory
+    or the startup time, with an optional parameter file for --validate:
+    > python benchmark.py --startup [parameter_file]
+    or the accuracy of the feature precision modes:
+    > python benchmark.py --features /input_directory
+    '''
+    if len(sys.argv) < 2:
+        print('Usage: python benchmark.py /input_directory')
+        print('       python benchmark.py --startup [parameter_file]')
+        print('       python benchmark.py --features /input_directory')
+        return
+    if sys.argv[1] == '--features':
+        featureModes(sys.argv[2])
+        return
+    if sys.argv[1] == '--startup':
+        startup(sys.argv[2] if len(sys.argv) > 2 else None)
+        return
+    benchmark(sys.argv[1])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import os, struct, socket
+import numpy as np
+import cv2
+
+# the .npy header is written with a fixed length, so that the final number
+# of crops can be filled in when the file is closed
+header_size = 128
+
+def npyHeader(shape):
+    '''
+    Header of a version 1.0 .npy file with uint8 data in C order, padded to
+    header_size bytes.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the array.
+
+    Returns
+    -------
+    bytes
+        The header.
+
+    '''
+    header = "{'descr': '|u1', 'fortran_order': False, 'shape': %s, }"%repr(tuple(shape))
+    header = header.ljust(header_size - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+def cropDroplet(img, contour, size, mode='resize'):
+    '''
+    Square crop of a droplet with a fixed size.
+
+    Parameters
+    ----------
+    img : array_like
+        The cropped grayscale frame.
+    contour : array_like
+        The outer contour of the droplet in the frame.
+    size : integer
+        The width and height of the crop.
+    mode : string, optional
+        'resize' scales the square around the bounding box of the droplet to
+        size, 'pad' cuts a size x size window around the droplet at the
+        original resolution. Parts outside the frame are black.
+
+    Returns
+    -------
+    crop : array_like
+        The size x size crop.
+    x, y : integer
+        The top left corner of the square in the frame.
+    side : integer
+        The side of the square in the frame.
+
+    '''
+    x, y, w, h = cv2.boundingRect(contour)
+    side = max(w, h) if mode == 'resize' else size
+    x0 = x + w//2 - side//2
+    y0 = y + h//2 - side//2
+    crop = np.zeros((side, side), dtype=np.uint8)
+    xs, ys = max(x0, 0), max(y0, 0)
+    xe, ye = min(x0 + side, img.shape[1]), min(y0 + side, img.shape[0])
+    crop[ys-y0:ye-y0, xs-x0:xe-x0] = img[ys:ye, xs:xe]
+    if side != size:
+        crop = cv2.resize(crop, (size, size),
+                          interpolation=cv2.INTER_AREA if side > size else cv2.INTER_LINEAR)
+    return crop, x0, y0, side
+
+
+class CropWriter():
+    '''
+        Writes droplet crops of a fixed size into a single .npy file in
+        chunks, without knowing the number of crops beforehand. The file can
+        be opened with np.load(filename, mmap_mode='r'), so training data is
+        read without decoding any image.
+    '''
+
+    def __init__(self, filename, size, mode='resize', chunk=256):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        filename : Path
+            The .npy file.
+        size : integer
+            The width and height of the crops.
+        mode : string, optional
+            'resize' or 'pad', see cropDroplet.
+        chunk : integer, optional
+            The number of crops collected before they are written.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.filename = filename
+        self.size = size
+        self.mode = mode
+        self.buffer = np.empty((chunk, size, size), dtype=np.uint8)
+        self.buffered = 0
+        self.n = 0
+        self.file = open(filename, 'wb')
+        self.file.write(npyHeader((0, size, size)))
+
+    def add(self, img, contour):
+        '''
+        Crop a droplet and add the crop.
+
+        Returns
+        -------
+        x, y, side : integer
+            The square of the crop in the frame, see cropDroplet.
+
+        '''
+        crop, x, y, side = cropDroplet(img, contour, self.size, self.mode)
+        self.buffer[self.buffered] = crop
+        self.buffered += 1
+        self.n += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+        return x, y, side
+
+    def write(self, crops):
+        '''
+        Add an array of crops as they are.
+        '''
+        self.flush()
+        self.file.write(np.ascontiguousarray(crops, dtype=np.uint8).tobytes())
+        self.n += len(crops)
+
+    def flush(self):
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.buffered = 0
+
+    def close(self):
+        '''
+        Write the remaining crops and the final number of crops.
+        '''
+        self.flush()
+        self.file.seek(0)
+        self.file.write(npyHeader((self.n, self.size, self.size)))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def mergeCrops(parts, filename, chunk=256):
+    '''
+    Concatenate the crop files of parts of a folder in the given order.
+
+    Parameters
+    ----------
+    parts : list
+        The .npy files of the parts.
+    filename : Path
+        The merged .npy file, it is replaced in one step.
+    chunk : integer, optional
+        The number of crops copied at once.
+
+    Returns
+    -------
+    None.
+
+    '''
+    size = np.load(str(parts[0]), mmap_mode='r').shape[1]
+    # workers on several hosts can merge the same folder
+    tmp = '%s.%s.%d.tmp'%(str(filename), socket.gethostname(), os.getpid())
+    with CropWriter(tmp, size) as writer:
+        for part in parts:
+            crops = np.load(str(part), mmap_mode='r')
+            for b in range(0, len(crops), chunk):
+                writer.write(crops[b:b+chunk])
+    os.replace(tmp, str(filename))
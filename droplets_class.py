@@ -20,13 +20,44 @@ https://opensource.org/licenses/BSD-3-Clause for full details
 import numpy as np
 import cv2
 
+def contourFeatures(cnt, precision='full', epsilon=1.0):
+    '''
+    Area and perimeter of a contour. They are computed once and shared by
+    the droplet filter and the Droplet.
+
+    Parameters
+    ----------
+    cnt : OpenCV vector
+        The outer contour of the droplet
+    precision : string, optional
+        'full' uses every point of the contour, 'fast' simplifies the
+        contour to a polygon with cv2.approxPolyDP first.
+    epsilon : float, optional
+        The largest distance in pixels between the polygon and the contour
+        in the fast mode.
+
+    Returns
+    -------
+    features : dictionary
+        The 'contour' the features are computed from, its 'area' and
+        'perimeter'.
+
+    '''
+    if precision == 'fast':
+        polygon = cv2.approxPolyDP(cnt, epsilon, True)
+        # fitEllipse needs at least 5 points
+        if len(polygon) >= 5:
+            cnt = polygon
+    return {'contour': cnt, 'area': cv2.contourArea(cnt),
+            'perimeter': cv2.arcLength(cnt, True)}
+
 class Droplet():
     '''
         The class Droplet collects all important characteristics of a microfluidic
         droplet.
     '''
 
-    def __init__(self, imagenumber, cnt, cutTop):
+    def __init__(self, imagenumber, cnt, cutTop, features=None):
         '''
         Initiate the class
 
@@ -39,6 +70,9 @@ class Droplet():
         cutTop : integer
             The number of pixels to be cut from the top and bottom to avoid
             channel edges to be disturbing analysis.
+        features : dictionary, optional
+            The features of the contour from contourFeatures, computed with
+            full precision if they are not given.
 
         Returns
         -------
@@ -48,16 +82,18 @@ class Droplet():
 
         self.imageNumber = imagenumber
         self.contour = cnt
+        if features is None:
+            features = contourFeatures(cnt)
+        cnt = features['contour']
 
         mom = cv2.moments(cnt)
         self.positionX = np.around(mom['m10']/mom['m00']).astype(np.uint16)
         self.positionY = np.around(mom['m01']/mom['m00']).astype(np.uint16)+cutTop
 
-        self.area = cv2.contourArea(cnt)
+        self.area = features['area']
+        self.perimeter = features['perimeter']
 
-        radii = np.zeros(len(cnt))
-        for j in range(len(cnt)):
-            radii[j] = np.sqrt((self.positionX-cnt[j][0][0])**2 + ((self.positionY-cutTop)-cnt[j][0][1])**2)
+        radii = np.sqrt((self.positionX-cnt[:, 0, 0])**2 + ((self.positionY-cutTop)-cnt[:, 0, 1])**2)
         self.rMean = np.mean(radii)
         self.rMed = np.median(radii)
         self.rStd = np.std(radii)
@@ -96,8 +132,7 @@ class Droplet():
             The isoperimetric quotient in the range 0 to 1.
 
         '''
-        perimeter = cv2.arcLength(self.contour, True)
-        ispmc = (4*np.pi*self.area)/((perimeter)**2)
+        ispmc = (4*np.pi*self.area)/((self.perimeter)**2)
         return ispmc
 
 
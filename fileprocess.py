@@ -19,6 +19,13 @@ https://opensource.org/licenses/BSD-3-Clause for full details
 """
 import os, sys, re, json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# single files that hold all frames of a run, see framesource.open_frame_source
+tiff_extensions = ['.tif', '.tiff']
+video_extensions = ['.avi', '.mp4', '.mov', '.mkv', '.wmv']
+# frames stored as one image file each
+image_extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff']
 
 def get_args():
     '''
@@ -40,6 +47,9 @@ def get_args():
 def printUsage():
     print('Usage:\npython droplet_segmentation.py <input folder name> <output folder name> or')
     print('python droplet_segmentation.py <parameter_file> in the json format')
+    print('python droplet_segmentation.py --validate <parameter_file> checks a run without running it')
+    print('python droplet_segmentation.py --serve [parameter_file] starts the segmentation service')
+    print('python droplet_segmentation.py --worker <parameter_file> starts a worker of the distributed mode')
     return
         
 def process_input_bg():
@@ -94,10 +104,12 @@ def process_input():
         if not (Path(args[0]).suffix == '.json'):
             print('Single argument is not a json-file.')
             printUsage()
+            return 0
         else:
             with open(Path(args[0])) as json_file:
                 parameters = json.load(json_file)
-            check_json_file(parameters)
+            if not check_json_file(parameters):
+                return 0
                 
     else:
         inputfolder=Path(args[0])
@@ -183,15 +195,9 @@ def list_image_files(inputfolder):
     lists image files in an input folder
     returns list of image files with paths to them
     '''
-    global image_extenstions
-    image_extensions=['png','jpg','jpeg','bmp','PNG','JPG','JPEG','BMP', 'tif', 
-                     'TIF', 'tiff', 'TIFF']
-    files = sorted(os.listdir(inputfolder), key = sortkey)
-    files = inputfolder.glob('*')
     imgfiles=[]
-    for i_file in files:
-        extension=i_file.suffix
-        if (str(extension)[1:] in image_extensions):
+    for i_file in Path(inputfolder).glob('*'):
+        if i_file.suffix.lower() in image_extensions:
             imgfiles.append(i_file)
     return imgfiles
 
@@ -201,27 +207,90 @@ def list_image_files_recursive(inputfolder):
     lists image files in an input folder and all sub folders
     returns list of image files with paths to them
     '''
-    global image_extenstions
-    image_extensions=['png','jpg','jpeg','bmp','PNG','JPG','JPEG','BMP']
-    files=sorted(os.listdir(inputfolder), key = sortkey)
     imgfiles=[]
-    for i_file in files:
-        if i_file.find(' ') > -1:               # ersetze leerzeichen durch unterstriche
-            i_file2 = i_file.replace(' ', '_')
-            os.rename(inputfolder+i_file, inputfolder+i_file2)
-            i_file = i_file2
-        if os.path.isdir(inputfolder+i_file) == True: # falls directory, rekursiver aufruf
-            subfiles = list_image_files_recursive(inputfolder+i_file+'/')
-            for i_subfile in subfiles:
-                imgfiles.append(i_subfile)
-        elif os.path.isfile(inputfolder+i_file) == True:
-            parts=i_file.split(".")
-            extension=parts[-1]
-            if (extension in image_extensions):
-                imgfiles.append(inputfolder+i_file)
+    for entry in crawlFolders(inputfolder, names=True, leaves=False):
+        imgfiles += [os.path.join(entry['folder'], i_file) for i_file in entry['files']]
     return imgfiles
 
 
+def scanFolder(folder, names=False):
+    '''
+    Sub folders and image files of a single folder. os.scandir gets the type
+    of the entries from the directory listing, so most file systems need no
+    extra stat call per entry.
+
+    Returns
+    -------
+    subfolders : list
+        The paths of the sub folders.
+    images : list or integer
+        The names of the image files if names is True, otherwise their number.
+
+    '''
+    subfolders = []
+    images = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subfolders.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in image_extensions and entry.is_file():
+                images.append(entry.name)
+    subfolders.sort(key=sortkey)
+    if names:
+        return subfolders, sorted(images, key=sortkey)
+    return subfolders, len(images)
+
+
+def crawlFolders(inputfolder, workers=16, names=False, leaves=True):
+    '''
+    Manifest of the folders on the lowest level below a folder and their
+    number of images. The folders are listed in parallel, which hides the
+    latency of network file systems, and nothing on disk is changed.
+
+    Parameters
+    ----------
+    inputfolder : Path
+        The root folder, it is its own only entry if it has no sub folders.
+    workers : integer, optional
+        The number of folders listed at the same time.
+    names : bool, optional
+        If True the entries also hold the names of the image files.
+    leaves : bool, optional
+        If False all folders are listed and not only the lowest level.
+
+    Returns
+    -------
+    manifest : list
+        One dictionary per folder on the lowest level, with the 'folder'
+        path, the number of 'images' and with names the image 'files'. The
+        folders are in the same sorted depth-first order as readfolders.
+
+    '''
+    root = os.path.normpath(str(inputfolder))
+    scanned = {}
+    with ThreadPoolExecutor(workers) as pool:
+        pending = {pool.submit(scanFolder, root, names): root}
+        while pending:
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder = pending.pop(future)
+                scanned[folder] = future.result()
+                for subfolder in scanned[folder][0]:
+                    pending[pool.submit(scanFolder, subfolder, names)] = subfolder
+    manifest = []
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        subfolders, images = scanned[folder]
+        if len(subfolders) == 0 or not leaves:
+            entry = {'folder': folder, 'images': len(images) if names else images}
+            if names:
+                entry['files'] = images
+            manifest.append(entry)
+        stack += reversed(subfolders)
+    return manifest
+
+
 def list_csv_files(inputfolder):
     '''
     lists csv files in an input folder
@@ -247,43 +316,67 @@ def readfolders(inputfolder):
     input: path to folder 
     output: array with paths of all sub folders on lowest level
     """
-    
-    files = sorted(os.listdir(inputfolder), key=sortkey)
+    root = os.path.normpath(str(inputfolder))
     folders = []
-    for i_files in files:
-        if i_files.find(' ') > -1:
-            i_files2 = i_files.replace(' ','_')
-            os.rename(inputfolder+i_files, inputfolder+i_files2)
-            i_files = i_files2
-        if os.path.isdir(inputfolder+i_files) == True:
-            subfiles = readfolders(inputfolder+i_files+'/')#, allfolders)
-            if len(subfiles) == 0:  # if no more subfolders, then current folder is lowest level  
-                folders.append(inputfolder+i_files+'/') # save current folder
-            else: # pass already found folders upward
-                for i_subfile in subfiles:
-                    folders.append(i_subfile)
-            
+    for entry in crawlFolders(inputfolder):
+        if entry['folder'] != root:
+            folders.append(entry['folder'].replace('\\', '/') + '/')
     return folders
       
 
-def matchImageNumberAndTable(folders, csvfiles, endung):
+def lastLine(filename, blocksize=4096):
+    '''
+    Reads the last line of a text file from its end, without reading the
+    whole file.
+    '''
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        while True:
+            start = max(size - blocksize, 0)
+            f.seek(start)
+            lines = f.read().splitlines()
+            if len(lines) > 1 or start == 0:
+                break
+            blocksize *= 2
+    return lines[-1].decode() if lines else ''
 
+def matchImageNumberAndTable(folders, csvfiles, endung, index=None, manifest=None):
+    '''
+    Compares the number of images in the folders with the last image number
+    of their result tables. With a results index (resultsindex.ResultsIndex)
+    the frame numbers are taken from the index instead of the tables. With a
+    manifest from crawlFolders the folders and their numbers of images are
+    taken from the manifest instead of listing every folder again.
+    '''
     csvNum = {}
     num = 0
+    imageNums = {}
+    if manifest is not None:
+        folders = [entry['folder'].replace('\\', '/') + '/' for entry in manifest]
+        imageNums = {folder: entry['images'] for folder, entry in zip(folders, manifest)}
     
-    for i_csv in csvfiles:
-        name = str.split(str.split(i_csv, '/')[-1], endung)[0]
-        with open(i_csv) as f:
-            lines = f.readlines()
-        m = re.search(r"0[0-9]+$", str.split(lines[-1], ';')[0])
-        csvNum[name] = int(m.group())
+    if index is not None:
+        for i_folder in folders:
+            name = str.split(i_folder, '/')[-2]
+            folder_id = index.folderId(name=name)
+            if folder_id is not None:
+                csvNum[name] = index.frameCount(folder_id)[1]
+    else:
+        for i_csv in csvfiles:
+            name = str.split(str.split(i_csv, '/')[-1], endung)[0]
+            m = re.search(r"0[0-9]+$", str.split(lastLine(i_csv), ';')[0])
+            csvNum[name] = int(m.group())
 
     for i_folder in folders:
         name = str.split(i_folder, '/')[-2]
-        imageNum = len(list_image_files(i_folder))
-        if imageNum-1 != csvNum[name]: 
+        if i_folder in imageNums:
+            imageNum = imageNums[i_folder]
+        else:
+            imageNum = len(list_image_files(Path(i_folder)))
+        if imageNum-1 != csvNum.get(name): 
             print("Keine Übereinstimmung:",name)
-            print("Image number:" ,imageNum,"csv Number:", csvNum[name])
+            print("Image number:" ,imageNum,"csv Number:", csvNum.get(name))
         else:
             num = num + 1
 
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import os, json, hashlib, platform
+from pathlib import Path
+import numpy as np
+import cv2
+from functions import cropFrame
+
+# increase when the way the cached frames are produced changes
+cache_version = 1
+
+class FrameCache():
+    '''
+        Cropped grayscale frames of a frame source, decoded once and stored as
+        a memory-mapped uint8 stack of shape (frames, height, width). The
+        cache is rebuilt when the input files or the crop parameters change.
+        The cache is built in a temporary file and moved in place, so several
+        processes can build and read the same cache at the same time.
+    '''
+
+    def __init__(self, cachefolder, source, cutTop, cutBottom, build=True):
+        '''
+        Initiate the class, the cache is built if it does not exist or does
+        not match the input.
+
+        Parameters
+        ----------
+        cachefolder : Path
+            Folder on a local disk where the cache files are stored.
+        source : FrameSource
+            The frames that are cached.
+        cutTop : integer
+            Number of pixels that are cut from the top of the frames.
+        cutBottom : integer
+            Negative number of pixels that are cut from the bottom of the
+            frames, 0 if nothing is cut.
+        build : bool, optional
+            Build a missing cache, otherwise FileNotFoundError is raised.
+
+        Returns
+        -------
+        None.
+
+        '''
+        cachefolder = Path(cachefolder)
+        if not cachefolder.exists():
+            cachefolder.mkdir(parents=True)
+        location = hashlib.sha1(str(source.path.resolve()).encode()).hexdigest()[:8]
+        basename = '%s_%s'%(source.name, location)
+        self.datafile = cachefolder/(basename+'.frames')
+        self.infofile = cachefolder/(basename+'.json')
+
+        key = {'version': cache_version,
+               'cutTop': cutTop,
+               'cutBottom': cutBottom,
+               'manifest': source.manifest()}
+        self.key = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+        info = self.readInfo()
+        if info is None and not build:
+            raise FileNotFoundError('No frame cache %s'%str(self.datafile))
+        if info is None:
+            print('Building frame cache %s'%str(self.datafile))
+            info = self.build(source, cutTop, cutBottom)
+        else:
+            print('Using frame cache %s'%str(self.datafile))
+        self.original_shape = info['original_shape']
+        self.frames = np.memmap(self.datafile, dtype=np.uint8, mode='r',
+                                shape=tuple(info['shape']))
+        self.shape = self.frames.shape
+
+    def readInfo(self):
+        '''
+        Read the description of an existing cache.
+
+        Returns
+        -------
+        info : dictionary
+            The description of the cache, None if there is no complete
+            cache for the current input.
+
+        '''
+        if not (self.infofile.exists() and self.datafile.exists()):
+            return None
+        try:
+            with open(self.infofile) as f:
+                info = json.load(f)
+        except ValueError:
+            return None
+        if info.get('key') != self.key:
+            return None
+        if self.datafile.stat().st_size != int(np.prod(info['shape'])):
+            return None
+        return info
+
+    def build(self, source, cutTop, cutBottom):
+        '''
+        Decode, crop and convert all frames to grayscale and write them to
+        the cache file. The frames are written to a file of this process and
+        moved in place when they are complete. A process reading the old
+        cache keeps its mapping of the replaced file.
+
+        Returns
+        -------
+        info : dictionary
+            The description of the new cache.
+
+        '''
+        try:
+            self.infofile.unlink()
+        except FileNotFoundError:
+            pass
+        first = source[0]
+        original_shape = [first.shape[0], first.shape[1]]
+        height, width = cropFrame(first, cutTop, cutBottom).shape[:2]
+        shape = [len(source), height, width]
+
+        suffix = '.%s.%d.tmp'%(platform.node(), os.getpid())
+        tmpdata = str(self.datafile) + suffix
+        try:
+            frames = np.memmap(tmpdata, dtype=np.uint8, mode='w+', shape=tuple(shape))
+            for i, img_rgb in enumerate(source):
+                frames[i] = cv2.cvtColor(cropFrame(img_rgb, cutTop, cutBottom),
+                                         cv2.COLOR_BGR2GRAY)
+            frames.flush()
+            del frames
+            os.replace(tmpdata, self.datafile)
+        except BaseException:
+            if os.path.exists(tmpdata):
+                os.remove(tmpdata)
+            raise
+
+        # the description is written last so that an interrupted build is
+        # never mistaken for a complete cache
+        info = {'key': self.key,
+                'shape': shape,
+                'original_shape': original_shape}
+        tmpfile = str(self.infofile) + suffix
+        with open(tmpfile, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmpfile, self.infofile)
+        return info
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, i):
+        '''
+        Cropped grayscale frame i, read without copying from the cache.
+        '''
+        return self.frames[i]
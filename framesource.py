@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import threading
+from queue import Queue, Full
+from collections import deque
+from pathlib import Path
+import numpy as np
+import cv2
+from fileprocess import list_image_files, sortkey, tiff_extensions, video_extensions
+
+def to_bgr(frame, low=None, high=None):
+    '''
+    Convert a frame to the 8-bit BGR format returned by cv2.imread. Frames
+    with more than 8 bit are scaled from the range low to high to 0 to 255,
+    so that a 12-bit camera keeps its full resolution.
+
+    Parameters
+    ----------
+    frame : array_like
+        A grayscale or colour frame of 8 or 16 bit.
+    low, high : integer, optional
+        The intensity range of frames with more than 8 bit, by default the
+        minimum and maximum of the frame.
+
+    Returns
+    -------
+    frame : array_like
+        The frame as a (height, width, 3) uint8 array.
+
+    '''
+    if frame.dtype != np.uint8:
+        if low is None:
+            low, high = frame.min(), frame.max()
+        scale = 255./max(float(high) - float(low), 1.)
+        frame = np.clip((frame.astype(np.float32) - float(low))*scale, 0, 255)
+        frame = np.rint(frame).astype(np.uint8)
+    if frame.ndim == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+class FrameSource():
+    '''
+        Base class for everything that frames can be read from. A frame source
+        has a length, supports random access by index and iterates over all
+        frames in order.
+    '''
+
+    def __init__(self, path):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        path : Path
+            The folder or file that the frames are read from.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.path = Path(path)
+        self.name = self.path.stem if self.path.is_file() else self.path.name
+        # frames can be read by several threads at the same time
+        self.threadSafe = True
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def read(self, i):
+        '''
+        Read a single frame.
+
+        Parameters
+        ----------
+        i : integer
+            The index of the frame.
+
+        Returns
+        -------
+        frame : array_like
+            The frame as an 8-bit BGR image.
+
+        '''
+        raise NotImplementedError
+
+    def frameName(self, i):
+        '''
+        Name of a frame that is used for the output files and the table.
+
+        Parameters
+        ----------
+        i : integer
+            The index of the frame.
+
+        Returns
+        -------
+        string
+            The name of the frame.
+
+        '''
+        return '%s_%06d'%(self.name, i)
+
+    def timestamp(self, i):
+        '''
+        Acquisition time of a frame in seconds, None if it is not known.
+        '''
+        return None
+
+    def manifest(self, frames=None):
+        '''
+        Name, size and modification time of the files the frames are read
+        from. Used to check if cached results still belong to the input.
+
+        Parameters
+        ----------
+        frames : tuple, optional
+            The first and the end frame number, only the files of these
+            frames are listed. All frames by default.
+
+        Returns
+        -------
+        list
+            One [name, size, mtime] entry per file.
+
+        '''
+        st = self.path.stat()
+        return [[self.path.name, st.st_size, st.st_mtime_ns]]
+
+    def close(self):
+        pass
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Frame %d is out of range'%i)
+        return self.read(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.read(i)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FolderSource(FrameSource):
+    '''
+        Frames stored as one image file per frame in a folder.
+    '''
+
+    def __init__(self, path):
+        FrameSource.__init__(self, path)
+        self.files = sorted(list_image_files(self.path), key=lambda f: sortkey(f.name))
+
+    def __len__(self):
+        return len(self.files)
+
+    def read(self, i):
+        frame = cv2.imread(str(self.files[i]))
+        if frame is None:
+            raise IOError('Frame %s could not be read'%str(self.files[i]))
+        return frame
+
+    def frameName(self, i):
+        return self.files[i].stem
+
+    def manifest(self, frames=None):
+        first, end = (0, len(self)) if frames is None else frames
+        manifest = []
+        for f in self.files[first:end]:
+            st = f.stat()
+            manifest.append([f.name, st.st_size, st.st_mtime_ns])
+        return manifest
+
+
+class TiffStackSource(FrameSource):
+    '''
+        Frames stored as the pages of a multi-page TIFF file. If tifffile is
+        installed and the stack is uncompressed it is memory-mapped, otherwise
+        the pages are decoded one at a time. Stacks with more than 8 bit are
+        scaled to 8 bit with the intensity range of the whole stack.
+    '''
+
+    def __init__(self, path, samples=16):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        path : Path
+            The TIFF file.
+        samples : integer, optional
+            The number of frames, spread over the stack, that the intensity
+            range of stacks with more than 8 bit is taken from.
+
+        Returns
+        -------
+        None.
+
+        '''
+        FrameSource.__init__(self, path)
+        self.stack = None
+        self.tif = None
+        self.samples = samples
+        self.range = None
+        # tifffile is optional and only imported for TIFF stacks
+        try:
+            import tifffile
+        except ImportError:
+            tifffile = None
+        if tifffile is not None:
+            self.tif = tifffile.TiffFile(str(self.path))
+            try:
+                self.stack = tifffile.memmap(str(self.path))
+                if self.stack.ndim == 2 or (self.stack.ndim == 3 and
+                                            self.stack.shape[-1] in (3, 4) and
+                                            len(self.tif.pages) == 1):
+                    self.stack = self.stack[np.newaxis]
+            except ValueError:
+                # compressed or non-contiguous pages can not be mapped
+                self.stack = None
+            self.n = len(self.tif.pages)
+        else:
+            self.n = cv2.imcount(str(self.path))
+
+    def __len__(self):
+        return self.n
+
+    def page(self, i):
+        '''
+        A frame as it is stored, colour frames in BGR order.
+        '''
+        if self.stack is not None:
+            frame = np.asarray(self.stack[i])
+        elif self.tif is not None:
+            frame = self.tif.pages[i].asarray()
+        else:
+            ret, mats = cv2.imreadmulti(str(self.path), i, 1,
+                                        flags=cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR)
+            return mats[0]
+        if frame.ndim == 3 and frame.shape[-1] == 3:
+            # TIFF stores RGB, OpenCV expects BGR
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        return frame
+
+    def intensityRange(self):
+        '''
+        Smallest and largest intensity of frames spread over the stack.
+        '''
+        if self.range is None:
+            low, high = np.inf, -np.inf
+            for i in np.unique(np.linspace(0, self.n - 1, min(self.samples, self.n)).astype(int)):
+                frame = self.page(i)
+                low, high = min(low, frame.min()), max(high, frame.max())
+            self.range = (low, high)
+        return self.range
+
+    def read(self, i):
+        frame = self.page(i)
+        if frame.dtype == np.uint8:
+            return to_bgr(frame)
+        return to_bgr(frame, *self.intensityRange())
+
+    def close(self):
+        if self.tif is not None:
+            self.tif.close()
+        self.stack = None
+
+
+class VideoSource(FrameSource):
+    '''
+        Frames stored in a video container that OpenCV can decode. Reading
+        the frames in order only decodes each frame once, random access
+        seeks in the video.
+    '''
+
+    def __init__(self, path):
+        FrameSource.__init__(self, path)
+        self.cap = cv2.VideoCapture(str(self.path))
+        if not self.cap.isOpened():
+            raise IOError('Video %s could not be opened'%str(self.path))
+        self.n = self.countFrames(int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.position = 0
+        # the capture has a single read position
+        self.threadSafe = False
+
+    def countFrames(self, n):
+        '''
+        The number of frames that can be read. The frame count in the header
+        of some containers is too high, so the frames at its end are grabbed
+        and the length is shortened to the last frame that can be read.
+
+        Parameters
+        ----------
+        n : integer
+            The frame count from the header.
+
+        Returns
+        -------
+        integer
+            The number of frames.
+
+        '''
+        count = 0
+        tail = 1
+        while n > 0:
+            start = max(n - tail, 0)
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            count = start
+            while count < n and self.cap.grab():
+                count += 1
+            if count > start or start == 0:
+                break
+            # the end of the stream is further back
+            tail *= 2
+        if count < n:
+            print('%s has %d frames, not %d as its header says'%(self.path.name, count, n))
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return count
+
+    def __len__(self):
+        return self.n
+
+    def read(self, i):
+        if i != self.position:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+        ret, frame = self.cap.read()
+        if not ret:
+            raise IOError('Frame %d could not be read from %s'%(i, str(self.path)))
+        self.position = i+1
+        return frame
+
+    def timestamp(self, i):
+        if self.fps > 0:
+            return i/self.fps
+        return None
+
+    def close(self):
+        self.cap.release()
+
+
+def open_frame_source(path):
+    '''
+    Open the frame source that fits the input, a folder of images, a
+    multi-page TIFF file or a video file.
+
+    Parameters
+    ----------
+    path : Path
+        The input folder or file.
+
+    Returns
+    -------
+    FrameSource
+        The frame source to read the frames from.
+
+    '''
+    path = Path(path)
+    if path.is_dir():
+        return FolderSource(path)
+    if path.suffix.lower() in tiff_extensions:
+        return TiffStackSource(path)
+    if path.suffix.lower() in video_extensions:
+        return VideoSource(path)
+    raise ValueError('%s is neither a folder, a TIFF stack nor a video'%str(path))
+
+
+def prefetch(iterable, depth):
+    '''
+    Iterate over an iterable in a background thread, so that up to depth
+    items, for example decoded frames, are ready when they are needed. The
+    thread stops when the generator is closed.
+
+    Parameters
+    ----------
+    iterable : iterable
+        The items, they are produced by a single thread in order.
+    depth : integer
+        The number of items read ahead, 0 reads in the calling thread.
+
+    Returns
+    -------
+    generator
+        The items in the same order.
+
+    '''
+    if depth <= 0:
+        yield from iterable
+        return
+    queue = Queue(depth)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # gives up when the consumer has stopped
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+        except Exception as e:
+            put((False, e))
+        put((True, done))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            ok, item = queue.get()
+            if not ok:
+                raise item
+            if item is done:
+                break
+            yield item
+    finally:
+        # also when the generator is closed before the end
+        stop.set()
+        thread.join()
+
+def orderedMap(pool, function, iterable, window):
+    '''
+    Like pool.map but only window items are submitted at the same time, so
+    that a long stream of frames is not read into memory at once.
+
+    Parameters
+    ----------
+    pool : Executor
+        The pool the function is run in, None runs it in the calling thread.
+    function : function
+        Called for every item.
+    iterable : iterable
+        The items.
+    window : integer
+        Maximal number of submitted items.
+
+    Returns
+    -------
+    generator
+        The results in the order of the items.
+
+    '''
+    if pool is None:
+        for item in iterable:
+            yield function(item)
+        return
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -18,9 +18,13 @@ License: BSD-3-Clause, see ./LICENSE or
 https://opensource.org/licenses/BSD-3-Clause for full details
 """
 
+import threading
 import numpy as np
-from skimage.draw import polygon
 import cv2
+from droplets_class import Droplet, contourFeatures
+
+# fill masks of removeBorderObjects, one per image shape and thread
+_border_masks = threading.local()
 
 def normalize(img):
     '''
@@ -59,36 +63,218 @@ def draw_mask(shape, x):
         A binary mask that masks out anything outside the polygon.
 
     '''
+    # scikit-image is only needed here and slow to import
+    from skimage.draw import polygon
     mask = np.zeros(shape, dtype=np.uint8)
     rr, cc = polygon(np.array(x[:, 0]), np.array(x[:, 1]))
     mask[rr, cc] = 255
 
     return mask
 
-def edgeoff2(img):
+def cropFrame(img, cutTop, cutBottom):
     '''
-    Buffer the edges of an image.
+    Cut away the top and bottom of an image.
 
     Parameters
     ----------
     img : array like
         The input image.
+    cutTop : integer
+        Number of pixels that are cut from the top of the image.
+    cutBottom : integer
+        Negative number of pixels that are cut from the bottom of the image,
+        0 if nothing is cut.
 
     Returns
     -------
     img : array like
-        The buffered image.
+        The cropped image, a view of the input image.
+
+    '''
+    if cutBottom == 0:
+        return img[cutTop:]
+    return img[cutTop:cutBottom]
+
+def stretchFrame(img):
+    '''
+    Stretch the intensities of an image to the full range 0 to 255.
+
+    Parameters
+    ----------
+    img : array like
+        The grayscale input image.
+
+    Returns
+    -------
+    img : array like
+        The stretched uint8 image.
 
     '''
+    img = img.astype(np.uint16)
+    cv2.normalize(img, img, 0, 255, cv2.NORM_MINMAX)
+    return img.astype(np.uint8)
+
+def medianFrame(stackfile, shape, indices=None, budget=2**26):
+    '''
+    Pixelwise median of a stack of uint8 frames stored in a raw file. The
+    median is computed for blocks of rows, that are read from the file
+    without mapping it, so the memory is bounded by budget and not by the
+    number of frames.
+
+    Parameters
+    ----------
+    stackfile : file
+        The file opened in binary mode, with the frames one after the other.
+    shape : tuple
+        The number of frames, height and width of the stack.
+    indices : array like, optional
+        The frames of the stack the median is taken of, all by default.
+    budget : integer, optional
+        The number of bytes of the blocks read at once.
+
+    Returns
+    -------
+    median : array like
+        The median image as float array.
+
+    '''
+    n, height, width = shape
+    if indices is None:
+        indices = np.arange(n)
+    rows = max(budget//(len(indices)*width), 1)
+    median = np.empty((height, width), dtype=np.float64)
+    for r in range(0, height, rows):
+        block = np.empty((len(indices), min(rows, height - r), width), dtype=np.uint8)
+        for j, i in enumerate(indices):
+            stackfile.seek((int(i)*height + r)*width)
+            stackfile.readinto(block[j])
+        median[r:r+rows] = np.median(block, axis=0)
+    return median
+
+def downsampleFrame(img, factor=4):
+    '''
+    Shrink a grayscale image by an integer factor, averaging the pixels.
+
+    Parameters
+    ----------
+    img : array like
+        The grayscale input image.
+    factor : integer, optional
+        The downsampling factor.
+
+    Returns
+    -------
+    img : array like
+        The downsampled image.
+
+    '''
+    return cv2.resize(img, (max(img.shape[1]//factor, 1), max(img.shape[0]//factor, 1)),
+                      interpolation=cv2.INTER_AREA)
+
+def changedFraction(img, background, factor=4, level=16):
+    '''
+    Cheap measure of the content of a frame, the fraction of the pixels of
+    the downsampled frame that differ from the downsampled background by
+    more than level grey values. Uniform changes of the illumination below
+    level and pixel noise, that is averaged out by the downsampling, do not
+    count.
+
+    Parameters
+    ----------
+    img : array like
+        The grayscale frame.
+    background : array like
+        The background image, downsampled with downsampleFrame.
+    factor : integer, optional
+        The downsampling factor of the background.
+    level : integer, optional
+        The smallest difference in grey values that counts as change.
+
+    Returns
+    -------
+    fraction : float
+        The fraction of changed pixels between 0 and 1.
+
+    '''
+    diff = cv2.absdiff(downsampleFrame(img, factor), background)
+    return cv2.countNonZero((diff > level).view(np.uint8))/diff.size
+
+def removeBorderObjects(img, minArea=None):
+    '''
+    Remove all objects that touch the border of a binary image, or the row
+    and column next to it, and clear the border itself. This is done with a
+    flood fill from the border, the fill mask is a uint8 buffer that is
+    reused between calls. The image is changed in place.
+
+    Parameters
+    ----------
+    img : array like
+        The binary uint8 input image.
+    minArea : float, optional
+        If given, the removed objects with a contour area larger than minArea
+        are reported. They are only searched for if enough pixels were
+        removed to contain one.
+
+    Returns
+    -------
+    img : array like
+        The image without the border objects.
+    removed : array like
+        One row per removed object larger than minArea with its bounding box
+        and contour area as left, top, width, height, area.
+
+    '''
+    shape = (img.shape[0]+2, img.shape[1]+2)
+    masks = getattr(_border_masks, 'masks', None)
+    if masks is None:
+        masks = _border_masks.masks = {}
+    if shape not in masks:
+        masks[shape] = np.zeros(shape, dtype=np.uint8)
+    mask = masks[shape]
+
     img[:, 0] = 1
     img[:, -1] = 1
     img[0, :] = 1
     img[-1, :] = 1
-    mask = np.zeros((img.shape[0]+2, img.shape[1]+2))
-    mask[1:-1, 1:-1] = np.where(img, 0, 2)
-    rect = cv2.floodFill(img, mask.astype(np.uint8), (0, 0), 0)
+    # the fill can not enter the background, the outer frame of the mask
+    # is never written so only the inside needs to be reset
+    np.equal(img, 0, out=mask[1:-1, 1:-1].view(bool))
+    area, img, mask, rect = cv2.floodFill(img, mask, (0, 0), 0, flags=4 | (255 << 8))
+
+    removed = np.zeros((0, 5))
+    border = 2*(img.shape[0]+img.shape[1]) - 4
+    if minArea is not None and area - border > minArea:
+        inside = (mask[2:-2, 2:-2] == 255).view(np.uint8)
+        contours, hierarchy = cv2.findContours(inside, cv2.RETR_EXTERNAL,
+                                               cv2.CHAIN_APPROX_SIMPLE)
+        objects = []
+        for cnt in contours:
+            cntArea = cv2.contourArea(cnt)
+            if cntArea > minArea:
+                x, y, w, h = cv2.boundingRect(cnt)
+                objects.append([x+1, y+1, w, h, cntArea])
+        if len(objects) > 0:
+            removed = np.array(objects)
 
-    return img
+    return img, removed
+
+def edgeoff2(img):
+    '''
+    Buffer the edges of an image, all objects connected to the border are
+    removed. See removeBorderObjects.
+
+    Parameters
+    ----------
+    img : array like
+        The input image.
+
+    Returns
+    -------
+    img : array like
+        The buffered image.
+
+    '''
+    return removeBorderObjects(img)[0]
 
 def equalize(img, n):
     '''
@@ -117,6 +303,58 @@ def equalize(img, n):
 
 ################################# Segmentation functions ####################################
 
+def laplacianImage(img):
+    '''
+    Edge image of the droplet borders as the blurred and normalized
+    Laplacian of the Gaussian blurred image. It only depends on the image and
+    can be reused when the segmentation is run with different parameters.
+
+    Parameters
+    ----------
+    img : array_like
+        An image conataining one or more microfluidic droplets.
+
+    Returns
+    -------
+    lapl : array_like
+        The blurred Laplacian image normalized to the range 0 to 255.
+    m : float
+        The level of the zero crossing in the normalized Laplacian image.
+
+    '''
+    blur = cv2.GaussianBlur(img, (5, 5), 2)
+    lapl, m = normalizeLaplacian(cv2.Laplacian(blur, cv2.CV_64F))
+
+    lapl = cv2.GaussianBlur(lapl, (3, 3), 1)
+
+    return lapl, m
+
+def normalizeLaplacian(lapl):
+    '''
+    Shift a Laplacian image to positive values and normalize it to the range
+    0 to 255.
+
+    Parameters
+    ----------
+    lapl : array_like
+        The float Laplacian image.
+
+    Returns
+    -------
+    lapl : array_like
+        The normalized uint8 Laplacian image.
+    m : float
+        The level of the zero crossing in the normalized Laplacian image.
+
+    '''
+    m = abs(lapl.min())
+    # the shifted image is converted while it is added, without a float copy
+    out = np.empty(lapl.shape, np.uint8)
+    np.add(lapl, m, out=out, casting='unsafe')
+    m = (255*m)/(out.max())
+    cv2.normalize(out, out, 0, 255, cv2.NORM_MINMAX)
+    return out, m
+
 def segmentDroplets(img, beadMin=100, beadMax=2000, dropMin=15000, 
                     dropMax=300000, offset=4):
     '''
@@ -154,17 +392,82 @@ def segmentDroplets(img, beadMin=100, beadMax=2000, dropMin=15000,
         Boundaries of the beads.
 
     '''
-    blur = cv2.GaussianBlur(img, (5, 5), 2)
-    lapl = cv2.Laplacian(blur, cv2.CV_64F)
-    m = abs(lapl.min())
-    lapl = (lapl+m).astype(np.uint8)
-    m = (255*m)/(lapl.max())
-    cv2.normalize(lapl, lapl, 0, 255, cv2.NORM_MINMAX)
+    lapl, m = laplacianImage(img)
 
-    lapl = cv2.GaussianBlur(lapl, (3, 3), 1)
+    return segmentLaplacian(lapl, m, beadMin, beadMax, dropMin, dropMax, offset)
+
+def segmentLaplacian(lapl, m, beadMin=100, beadMax=2000, dropMin=15000,
+                     dropMax=300000, offset=4):
+    '''
+    The parameter dependent part of segmentDroplets, that segments droplets
+    and beads from the Laplacian image given by laplacianImage. The single
+    steps are also available as the stages of pipeline.segmentationPipeline.
+
+    Parameters
+    ----------
+    lapl : array_like
+        The normalized Laplacian image, it is not changed.
+    m : float
+        The level of the zero crossing in the Laplacian image.
+    beadMin, beadMax, dropMin, dropMax, offset : float, optional
+        See segmentDroplets.
+
+    Returns
+    -------
+    See segmentDroplets.
+
+    '''
+    thresh = thresholdLaplacian(lapl, m, offset)
+    thresh = removeSmallObjects(thresh, beadMin)
+    thresh = closeEdges(thresh)
+    droplets_outer, droplets_inner, beads = classifyObjects(thresh, beadMin, beadMax,
+                                                            dropMin, dropMax)
+    droplets_outer, droplets_inner, beads = refineDroplets(droplets_outer, droplets_inner,
+                                                           beads, dropMin, dropMax)
+
+    return thresh, droplets_outer, droplets_inner, beads
+
+def thresholdLaplacian(lapl, m, offset=4):
+    '''
+    Binary edge image from thresholding the Laplacian image.
+
+    Parameters
+    ----------
+    lapl : array_like
+        The normalized Laplacian image.
+    m : float
+        The level of the zero crossing in the Laplacian image.
+    offset: float, optional
+        Offset above the zero crossing for the threshold. Default value is 4.
+
+    Returns
+    -------
+    thresh : array_like
+        The binary edge image.
 
+    '''
     ret, thresh = cv2.threshold(lapl, m+offset, 1, 0)
+    return thresh
+
+def removeSmallObjects(thresh, beadMin=100):
+    '''
+    Remove objects smaller than the smallest possible bead from the binary
+    edge image. The image is changed in place.
 
+    Parameters
+    ----------
+    thresh : array_like
+        The binary edge image.
+    beadMin : float, optional
+        The minimum area, in pixels for an object to possibly be a bead.
+        The default is 100.
+
+    Returns
+    -------
+    thresh : array_like
+        The binary edge image without the small objects.
+
+    '''
     contours, hierarchy = cv2.findContours(thresh.copy(),
                                            cv2.RETR_CCOMP,
                                            cv2.CHAIN_APPROX_SIMPLE)
@@ -173,11 +476,40 @@ def segmentDroplets(img, beadMin=100, beadMax=2000, dropMin=15000,
         if cv2.contourArea(cnt) < beadMin:
             cv2.drawContours(thresh, [cnt], -1, 0, -1)
 
-    thresh = cv2.morphologyEx(thresh,
-                              cv2.MORPH_CLOSE,
-                              cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
-                                                        (3, 3)))
+    return thresh
+
+def closeEdges(thresh):
+    '''
+    Close small gaps in the binary edge image.
+    '''
+    return cv2.morphologyEx(thresh,
+                            cv2.MORPH_CLOSE,
+                            cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
+                                                      (3, 3)))
 
+def classifyObjects(thresh, beadMin=100, beadMax=2000, dropMin=15000,
+                    dropMax=300000):
+    '''
+    Sort the objects in the binary edge image into droplet borders and beads
+    according to their size, shape and position in the contour hierarchy.
+
+    Parameters
+    ----------
+    thresh : array_like
+        The binary edge image.
+    beadMin, beadMax, dropMin, dropMax : float, optional
+        See segmentDroplets.
+
+    Returns
+    -------
+    droplets_outer : array_like
+        The outer boundary of the droplet.
+    droplets_inner : array_like
+        The inner boundary of the droplet.
+    beads : array_like
+        Boundaries of the beads.
+
+    '''
     contours, hierarchy = cv2.findContours(thresh.copy(), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
 
     droplets_outer = np.zeros_like(thresh)
@@ -216,6 +548,35 @@ def segmentDroplets(img, beadMin=100, beadMax=2000, dropMin=15000,
                 cv2.drawContours(droplets_inner, [hull], -1, 1, -1)
                 cv2.drawContours(droplets_inner, [cnt], -1, 0, -1)
 
+    return droplets_outer, droplets_inner, beads
+
+def refineDroplets(droplets_outer, droplets_inner, beads, dropMin=15000,
+                   dropMax=300000):
+    '''
+    Clean up the droplet borders and fall back to closed outer borders or
+    closed bead areas when no inner or outer droplet border was found.
+
+    Parameters
+    ----------
+    droplets_outer : array_like
+        The outer boundary of the droplet from classifyObjects.
+    droplets_inner : array_like
+        The inner boundary of the droplet from classifyObjects.
+    beads : array_like
+        Boundaries of the beads from classifyObjects.
+    dropMin, dropMax : float, optional
+        See segmentDroplets.
+
+    Returns
+    -------
+    droplets_outer : array_like
+        The outer boundary of the droplet.
+    droplets_inner : array_like
+        The inner boundary of the droplet.
+    beads : array_like
+        Boundaries of the beads inside the droplets.
+
+    '''
     droplets_inner = cv2.morphologyEx(droplets_inner,
                                       cv2.MORPH_OPEN,
                                       cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
@@ -247,6 +608,7 @@ def segmentDroplets(img, beadMin=100, beadMax=2000, dropMin=15000,
                     cv2.drawContours(droplets_inner, [cnt], -1, 0, 1) # subtract contour
 
     if np.sum(droplets_outer) == 0:
+        droplets_outer = droplets_outer.copy()
         closed_beads = cv2.morphologyEx(beads, cv2.MORPH_CLOSE,
                                         cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
                                                                   (9, 9)))
@@ -263,7 +625,60 @@ def segmentDroplets(img, beadMin=100, beadMax=2000, dropMin=15000,
 
     beads = beads*droplets_outer
 
-    return thresh, droplets_outer, droplets_inner, beads
+    return droplets_outer, droplets_inner, beads
+
+##################################################################
+
+def extractDroplets(droplets_outer, imgname, dropMin, cutTop, precision='full', epsilon=1.0):
+    '''
+    Turn the segmented outer droplet areas into droplets. Droplets that touch
+    the image border, are too small or not round enough are left out.
+
+    Parameters
+    ----------
+    droplets_outer : array_like
+        The outer boundary of the droplets from segmentDroplets, objects
+        touching the border are removed in place.
+    imgname : string
+        The name of the image that is being processed.
+    dropMin : float
+        The minimum area, in pixels for an object to be a droplet.
+    cutTop : integer
+        Number of pixels that are cut from the top of the image.
+    precision : string, optional
+        'full' or 'fast', see droplets_class.contourFeatures.
+    epsilon : float, optional
+        The tolerance of the simplified contours in the fast mode.
+
+    Returns
+    -------
+    drop_array : list
+        The Droplet objects found in the image.
+    truncated : array_like
+        Bounding box and area, see removeBorderObjects, of every object
+        larger than dropMin that was removed for touching the border and
+        does not span the whole width or height of the image.
+
+    '''
+    droplets_outer, removed = removeBorderObjects(droplets_outer, dropMin)
+    # objects that span the whole image are the channel walls
+    height, width = droplets_outer.shape
+    truncated = removed[(removed[:, 2] < width-2) & (removed[:, 3] < height-2)]
+
+    contours, hierarchy = cv2.findContours(droplets_outer.copy(),
+                                           cv2.RETR_CCOMP,
+                                           cv2.CHAIN_APPROX_SIMPLE)
+
+    drop_array = []
+    for i, cnt in enumerate(contours):
+        features = contourFeatures(cnt, precision, epsilon)
+        if (features['area'] > dropMin and
+                (4*np.pi*features['area'])/(features['perimeter']**2) > 0.5):
+            drop = Droplet(imgname, cnt, cutTop, features)
+            if drop.checkDropletPosition(droplets_outer.shape):
+                drop_array.append(drop)
+
+    return drop_array, truncated
 
 ##################################################################
 
@@ -302,6 +717,183 @@ def seperateSingleBeads(beads, seperator):
 
 #################################################################
 
+def beadsPerClump(areas, clumpsizes):
+    '''
+    Estimate the number of beads in bead clusters from their areas.
+
+    Parameters
+    ----------
+    areas : array_like
+        The areas of the clusters in pixels.
+    clumpsizes : array_like
+        The typical area of clusters with 1, 2, 3, ... beads.
+
+    Returns
+    -------
+    n : array_like
+        The estimated number of beads per cluster. Clusters larger than the
+        largest typical area are extrapolated with its area per bead.
+
+    '''
+    areas = np.asarray(areas, dtype=float)
+    n = np.argmin(np.abs(areas[:, np.newaxis] - clumpsizes[np.newaxis, :]), axis=1) + 1
+    large = areas > clumpsizes[-1]
+    n[large] = np.round(areas[large]*len(clumpsizes)/clumpsizes[-1]).astype(int)
+    return n
+
+def labelContourAreas(mask, labels, n):
+    '''
+    Area of the labelled objects of a mask measured with cv2.contourArea,
+    the way the typical clump sizes are measured. It is smaller than the
+    number of pixels of an object.
+
+    Parameters
+    ----------
+    mask : array_like
+        The uint8 mask of the objects.
+    labels : array_like
+        Label image of the mask with 8-connectivity.
+    n : integer
+        The number of labels including the background.
+
+    Returns
+    -------
+    areas : array_like
+        The area of the objects 1 to n-1.
+
+    '''
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    areas = np.zeros(n-1)
+    for cnt, h in zip(contours, hierarchy[0] if hierarchy is not None else []):
+        # only the outer border of every object, not its holes
+        if h[3] < 0:
+            x, y = cnt[0, 0]
+            areas[labels[y, x] - 1] += cv2.contourArea(cnt)
+    return areas
+
+def labelColors(img_rgb, hsv, labels, n):
+    '''
+    Mean and median colour of all labelled objects of an image, computed in
+    one pass over the object pixels.
+
+    Parameters
+    ----------
+    img_rgb : array_like
+        The BGR image.
+    hsv : array_like
+        The image converted to HSV.
+    labels : array_like
+        Label image where 0 is background and 1 to n-1 are the objects.
+    n : integer
+        The number of labels including the background.
+
+    Returns
+    -------
+    colors : array_like
+        Array of shape (n-1, 12) with the mean B, G, R, the median B, G, R,
+        the mean H, S, V and the median H, S, V of every object. Hue is in
+        the OpenCV range 0 to 180 and its mean is the circular mean.
+
+    '''
+    idx = np.flatnonzero(labels)
+    lab = labels.ravel()[idx]
+    counts = np.bincount(lab, minlength=n)[1:]
+    # position of the middle pixels of every object in the pixels sorted by label
+    starts = np.cumsum(counts) - counts
+    lower = starts + (counts-1)//2
+    upper = starts + counts//2
+
+    colors = np.zeros((n-1, 12))
+    for image, offset in [(img_rgb, 0), (hsv, 6)]:
+        for c in range(3):
+            values = image[:, :, c].ravel()[idx].astype(float)
+            colors[:, offset+c] = np.bincount(lab, weights=values, minlength=n)[1:]/counts
+            ordered = values[np.lexsort((values, lab))]
+            colors[:, offset+3+c] = (ordered[lower] + ordered[upper])/2
+    # hue is an angle, 180 corresponds to 360 degrees
+    angle = hsv[:, :, 0].ravel()[idx].astype(float)*np.pi/90
+    s = np.bincount(lab, weights=np.sin(angle), minlength=n)[1:]
+    c = np.bincount(lab, weights=np.cos(angle), minlength=n)[1:]
+    colors[:, 6] = (np.arctan2(s, c)*90/np.pi) % 180
+    return colors
+
+def assignBeads(beads, clumps, drop_array, clumpsizes, cutTop, img_rgb=None):
+    '''
+    Count the single beads and bead clusters and add them to the droplets
+    they lie in. All objects are labelled once and assigned by looking up
+    their centroid in a label image of the droplets.
+
+    Parameters
+    ----------
+    beads : array_like
+        Mask of the single beads.
+    clumps : array_like
+        Mask of the bead clusters.
+    drop_array : list
+        The Droplet objects of the image, the beads are added to them.
+    clumpsizes : array_like
+        The typical area of clusters with 1, 2, 3, ... beads.
+    cutTop : integer
+        Number of pixels that are cut from the top of the image.
+    img_rgb : array_like, optional
+        The cropped BGR image. If given, the colour of every bead object is
+        measured with labelColors and stored as the quality of the beads.
+
+    Returns
+    -------
+    counts : array_like
+        The number of beads in every droplet.
+    objects : list
+        One list per bead object inside a droplet with the droplet index,
+        the position x, y in the cropped image, the number of beads, the area
+        and, if img_rgb is given, the 12 colour features.
+
+    '''
+    counts = np.zeros(len(drop_array), dtype=int)
+    objects = []
+    if len(drop_array) == 0:
+        return counts, objects
+
+    hsv = None
+    if img_rgb is not None:
+        # converted once for the single beads and the clusters
+        hsv = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2HSV)
+    droplabels = np.zeros(beads.shape, dtype=np.int32)
+    for k, drop in enumerate(drop_array):
+        cv2.drawContours(droplabels, [drop.contour], -1, k+1, -1)
+
+    for mask, single in [(beads, True), (clumps, False)]:
+        mask = mask.astype(np.uint8)
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if n < 2:
+            continue
+        stats = stats[1:]
+        centroids = centroids[1:]
+        if single:
+            nbeads = np.ones(n-1, dtype=int)
+        else:
+            nbeads = beadsPerClump(labelContourAreas(mask, labels, n), clumpsizes)
+        cx = np.clip(np.round(centroids[:, 0]).astype(int), 0, beads.shape[1]-1)
+        cy = np.clip(np.round(centroids[:, 1]).astype(int), 0, beads.shape[0]-1)
+        owner = droplabels[cy, cx] - 1
+        colors = None
+        if img_rgb is not None:
+            colors = labelColors(img_rgb, hsv, labels, n)
+        for j in np.flatnonzero(owner >= 0):
+            quality = None if colors is None else tuple(colors[j, :3])
+            for b in range(nbeads[j]):
+                drop_array[owner[j]].addBead(cx[j], cy[j], cutTop, quality)
+            obj = [owner[j], cx[j], cy[j], nbeads[j], stats[j, cv2.CC_STAT_AREA]]
+            if colors is not None:
+                obj += list(colors[j])
+            objects.append(obj)
+        counts += np.bincount(owner[owner >= 0], weights=nbeads[owner >= 0],
+                              minlength=len(drop_array)).astype(int)
+
+    return counts, objects
+
+#################################################################
+
 def seperateBeadsFromBorder(droplets_inner, beads, beadMin, imgname):
     '''
     Seperate the beads from the border to ensure droplet border integrity
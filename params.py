@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import os, sys, json, time, hashlib, platform
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from fileprocess import crawlFolders, tiff_extensions, video_extensions
+
+__version__ = '0.2'
+
+class Parameter():
+    '''
+        Description of a run parameter in the JSON file.
+    '''
+
+    def __init__(self, name, types, default=None, message=None, check=None,
+                 choices=None, required=False):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        name : string
+            The key of the parameter in the JSON file.
+        types : tuple
+            The accepted types of the value.
+        default : optional
+            The value used when the parameter is missing.
+        message : string, optional
+            Message shown when the default value is used.
+        check : tuple, optional
+            A function that returns True for valid values and the
+            description of a valid value.
+        choices : list, optional
+            The allowed values.
+        required : bool, optional
+            True if the parameter has no default.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.name = name
+        self.types = types
+        self.default = default
+        self.message = message
+        self.check = check
+        self.choices = choices
+        self.required = required
+
+    def validate(self, value):
+        '''
+        Check a value of the parameter.
+
+        Returns
+        -------
+        error : string
+            Description of the problem, None if the value is valid.
+
+        '''
+        # bool is a subclass of int but not a valid number here
+        if not isinstance(value, self.types) or (isinstance(value, bool) and
+                                                 bool not in self.types):
+            return "'%s' has to be of type %s, not %s"%(self.name,
+                                                       ' or '.join(t.__name__ for t in self.types),
+                                                       type(value).__name__)
+        if self.choices is not None and value not in self.choices:
+            return "'%s' has to be one of %s, not %s"%(self.name,
+                                                      ', '.join(str(c) for c in self.choices),
+                                                      str(value))
+        if self.check is not None and not self.check[0](value):
+            return "'%s' has to be %s, not %s"%(self.name, self.check[1], str(value))
+        return None
+
+number = (int, float)
+path = (str, Path)
+positive = (lambda v: v > 0, 'larger than 0')
+nonnegative = (lambda v: v >= 0, 'at least 0')
+
+schema = [Parameter('inputfolder', path, required=True),
+          Parameter('outputfolder', path, required=True),
+          # kept for existing parameter files, the segmentation never used
+          # the background subtracted frames
+          Parameter('bg subtraction', (bool,), True),
+          Parameter('n bg', (int,), 5,
+                    'Number of images for background substraction is set to the default number 5',
+                    positive),
+          Parameter('bg sampling', (str,), 'spread', None, choices=['spread', 'first']),
+          Parameter('cutTop', (int,), 40,
+                    'The cut at the top of the image is set to the standard of 40 pixels',
+                    nonnegative),
+          Parameter('cutBottom', (int,), -60,
+                    'The cut at the bottom of the image is set to the standard of 60 pixels',
+                    (lambda v: v <= 0, '0 or negative')),
+          Parameter('dropMin', number, 5000,
+                    'Droplet minimal size is set to the default of 5000 pixels',
+                    positive),
+          Parameter('dropMax', number, 300000,
+                    'Droplet maximal size is set to the default of 300000 pixels',
+                    positive),
+          Parameter('beadMin', number, 140, None, positive),
+          Parameter('beadMax', number, 20000, None, positive),
+          Parameter('offset', number, 4,
+                    'Offset of the Laplacian image thresholding set to the default of 4'),
+          Parameter('feature precision', (str,), 'full', None, choices=['full', 'fast']),
+          Parameter('contour epsilon', number, 1.0, None, positive),
+          Parameter('save images', (bool,), True,
+                    'The run will be saving the segmentation images (Default)'),
+          Parameter('save masks', (bool,), False,
+                    'The run will not be saving the masks of the segmentation (Default)'),
+          Parameter('save every x image', (int,), 10,
+                    'The run will be saving every 10th segentation image (Default)',
+                    positive),
+          Parameter('bead colors', (bool,), False),
+          Parameter('skip threshold', number, 0, None,
+                    (lambda v: 0 <= v <= 1, 'between 0 and 1')),
+          Parameter('frame cache', path + (type(None),), None),
+          Parameter('sweep', (dict, type(None)), None),
+          Parameter('workers', (int, type(None)), None, None,
+                    (lambda v: v is None or v > 0, 'larger than 0')),
+          Parameter('prefetch', (int,), 4, None, nonnegative),
+          Parameter('output format', (str,), 'csv', None, choices=['csv', 'tsv']),
+          Parameter('crop size', (int, type(None)), None, None,
+                    (lambda v: v is None or v > 0, 'positive or null')),
+          Parameter('crop mode', (str,), 'resize', None, choices=['resize', 'pad']),
+          Parameter('manifest', (bool,), True),
+          Parameter('summary', (bool,), True),
+          Parameter('summary interval', number, 10, None, positive),
+          Parameter('results index', path + (type(None),), None),
+          Parameter('queue', path + (type(None),), None),
+          Parameter('frames per task', (int, type(None)), None, None,
+                    (lambda v: v is None or v > 0, 'larger than 0')),
+          Parameter('stale seconds', number, 600, None, positive),
+          Parameter('hash inputs', (bool,), True)]
+
+parameter_names = [p.name for p in schema]
+parameter_schema = {p.name: p for p in schema}
+
+def resolveParameters(parameters, verbose=True, requireFolders=True):
+    '''
+    Validate the run parameters and fill in the defaults, before anything
+    expensive is done.
+
+    Parameters
+    ----------
+    parameters : dictionary
+        The parameters from the JSON file or the command line.
+    verbose : bool, optional
+        Show the messages for the parameters that are set to their default.
+    requireFolders : bool, optional
+        The input and output folder have to be given. False when the
+        parameters only configure the segmentation of single frames.
+
+    Returns
+    -------
+    resolved : dictionary
+        All parameters of the schema, the folders as Path.
+    errors : list
+        Descriptions of the invalid parameters, empty if all are valid.
+
+    '''
+    resolved = {}
+    errors = []
+    for key in parameters.keys():
+        if key not in parameter_names:
+            print("Unknown parameter '%s' is ignored"%key)
+    for p in schema:
+        if p.name in parameters:
+            value = parameters[p.name]
+            error = p.validate(value)
+            if error is not None:
+                errors.append(error)
+            resolved[p.name] = value
+        elif p.required and requireFolders:
+            errors.append("'%s' has to be specified"%p.name)
+        else:
+            if verbose and p.message is not None:
+                print(p.message)
+            resolved[p.name] = p.default
+    if errors:
+        return resolved, errors
+
+    for key in ['inputfolder', 'outputfolder']:
+        if resolved[key] is not None:
+            resolved[key] = Path(resolved[key])
+    if resolved['inputfolder'] is not None and not resolved['inputfolder'].exists():
+        errors.append('Input %s does not exist'%str(resolved['inputfolder']))
+    if resolved['outputfolder'] is not None and (resolved['outputfolder'].exists() and
+                                                 not resolved['outputfolder'].is_dir()):
+        errors.append('Output %s is not a folder'%str(resolved['outputfolder']))
+    if resolved['dropMax'] <= resolved['dropMin']:
+        errors.append("'dropMax' has to be larger than 'dropMin'")
+    if resolved['beadMax'] <= resolved['beadMin']:
+        errors.append("'beadMax' has to be larger than 'beadMin'")
+    if resolved['sweep'] is not None:
+        for key, values in resolved['sweep'].items():
+            if key not in ['offset', 'dropMin', 'dropMax', 'beadMin', 'beadMax']:
+                errors.append("'%s' can not be swept"%key)
+            elif not isinstance(values, list) or len(values) == 0:
+                errors.append("The sweep values of '%s' have to be a non-empty list"%key)
+            else:
+                # every swept value has to be valid as value of the parameter
+                for value in values:
+                    error = parameter_schema[key].validate(value)
+                    if error is not None:
+                        errors.append('Sweep value: ' + error)
+    return resolved, errors
+
+def loadParameters(parameters, verbose=True, requireFolders=True):
+    '''
+    Resolve the parameters and print all problems, see resolveParameters.
+
+    Returns
+    -------
+    resolved : dictionary
+        The resolved parameters, None if they are invalid.
+
+    '''
+    resolved, errors = resolveParameters(parameters, verbose, requireFolders)
+    if errors:
+        print('Invalid parameters:')
+        for error in errors:
+            print('    ' + error)
+        return None
+    return resolved
+
+def writableFolder(folder):
+    '''
+    Check that files can be created in a folder, or in the nearest existing
+    folder above it if it does not exist yet.
+    '''
+    folder = Path(folder).absolute()
+    while not folder.exists():
+        folder = folder.parent
+    return folder.is_dir() and os.access(str(folder), os.W_OK)
+
+def validateRun(parameters):
+    '''
+    Dry run, check the parameters and the inputs and outputs of a run
+    without reading any frame or importing the imaging libraries.
+
+    Parameters
+    ----------
+    parameters : dictionary
+        The parameters from the JSON file.
+
+    Returns
+    -------
+    bool
+        True if the run can be started.
+
+    '''
+    resolved = loadParameters(parameters, verbose=False)
+    if resolved is None:
+        return False
+    errors = []
+    inputfolder = resolved['inputfolder']
+    workerRun = resolved['queue'] is not None or resolved['frames per task'] is not None
+    if inputfolder.is_dir():
+        manifest = crawlFolders(inputfolder)
+        images = sum(entry['images'] for entry in manifest)
+        if len(manifest) == 1 and manifest[0]['folder'] == os.path.normpath(str(inputfolder)):
+            print('%d images in %s'%(images, str(inputfolder)))
+            if images < resolved['n bg'] and resolved['skip threshold'] > 0:
+                print("Fewer images than 'n bg', the background uses all %d"%images)
+        else:
+            print('%d images in %d folders on the lowest level of %s, use --worker to segment all of them'
+                  %(images, len(manifest), str(inputfolder)))
+            workerRun = True
+        if images == 0:
+            errors.append('No images in %s'%str(inputfolder))
+    elif inputfolder.suffix.lower() in tiff_extensions:
+        print('TIFF stack %s'%str(inputfolder))
+    elif inputfolder.suffix.lower() in video_extensions:
+        print('Video %s'%str(inputfolder))
+    else:
+        errors.append('%s is neither a folder, a TIFF stack nor a video'%str(inputfolder))
+    if resolved['frames per task'] is not None and resolved['frame cache'] is not None:
+        print("The tasks of 'frames per task' only read an existing 'frame cache', a normal run of a "
+              "folder builds it")
+    if workerRun and resolved['results index'] is not None:
+        # SQLite locking is not reliable on shared network filesystems
+        errors.append("'results index' can not be used with --worker")
+    for key in ['outputfolder', 'frame cache', 'queue']:
+        if resolved[key] is not None and not writableFolder(resolved[key]):
+            errors.append("'%s' %s is not writable"%(key, str(resolved[key])))
+    if resolved['results index'] is not None and not writableFolder(Path(resolved['results index']).parent):
+        errors.append("'results index' %s is not writable"%str(resolved['results index']))
+    if errors:
+        print('Invalid run:')
+        for error in errors:
+            print('    ' + error)
+        return False
+    print('The parameters and inputs are valid')
+    return True
+
+##############################################################################################
+
+def hashFile(filename, blocksize=1 << 20):
+    '''
+    SHA-1 hash of the content of a file.
+    '''
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        block = f.read(blocksize)
+        while block:
+            h.update(block)
+            block = f.read(blocksize)
+    return h.hexdigest()
+
+def softwareVersions():
+    '''
+    Versions of Python, the script and the libraries used for the run.
+    '''
+    import numpy as np
+    import cv2
+    versions = {'droplet_segmentation': __version__,
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'opencv': cv2.__version__,
+                'platform': platform.platform()}
+    try:
+        import tifffile
+        versions['tifffile'] = tifffile.__version__
+    except ImportError:
+        pass
+    return versions
+
+def writeManifest(filename, parameters, source, timing, workers=1, hashes=True, frames=None):
+    '''
+    Write the run manifest, the information needed to reproduce a run, as
+    JSON file.
+
+    Parameters
+    ----------
+    filename : Path
+        The manifest file.
+    parameters : dictionary
+        The resolved run parameters.
+    source : FrameSource
+        The frames of the run.
+    timing : dictionary
+        Timing summary of the run.
+    workers : integer, optional
+        Number of threads used for hashing the input files.
+    hashes : bool, optional
+        Hash the content of the input files, otherwise only their name,
+        size and modification time are stored.
+    frames : tuple, optional
+        The first and the end frame number of a run of part of the frames,
+        only the inputs of these frames are listed.
+
+    Returns
+    -------
+    None.
+
+    '''
+    inputs = source.manifest(frames)
+    if hashes:
+        folder = source.path if source.path.is_dir() else source.path.parent
+        with ThreadPoolExecutor(workers) as pool:
+            digests = list(pool.map(hashFile, [folder/entry[0] for entry in inputs]))
+        for entry, digest in zip(inputs, digests):
+            entry.append(digest)
+
+    manifest = {'command': sys.argv,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'host': platform.node(),
+                'software': softwareVersions(),
+                'parameters': {k: (str(v) if isinstance(v, Path) else v)
+                               for k, v in parameters.items()},
+                'frames': len(source) if frames is None else frames[1] - frames[0],
+                'inputs': {'fields': ['name', 'size', 'mtime_ns'] + (['sha1'] if hashes else []),
+                           'files': inputs},
+                'timing': timing}
+    # replaced in one step, several workers can write the manifest of a merged folder
+    tmp = '%s.%s.%d.tmp'%(str(filename), platform.node(), os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, str(filename))
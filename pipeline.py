@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import time, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from functions import laplacianImage, thresholdLaplacian, removeSmallObjects
+from functions import closeEdges, classifyObjects, refineDroplets
+
+class Stage():
+    '''
+        A single step of the segmentation. The stage calls a function with
+        the outputs of earlier stages and the run parameters it depends on.
+    '''
+
+    def __init__(self, name, function, inputs, parameters, outputs, inplace=False):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        name : string
+            Name of the stage, used to replace it and in the timings.
+        function : function
+            Called as function(*inputs, *parameters).
+        inputs : list
+            Names of the data the function is called with, 'img' is the
+            frame and the rest are outputs of earlier stages.
+        parameters : list
+            Names of the run parameters the function is called with.
+        outputs : list
+            Names of the values the function returns.
+        inplace : bool, optional
+            True if the function changes its input images, they are then
+            copied before the call when the inputs come from a cache.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.parameters = list(parameters)
+        self.outputs = list(outputs)
+        self.inplace = inplace
+
+    def identity(self):
+        '''
+        String that identifies the implementation of the stage.
+        '''
+        return '%s.%s'%(self.function.__module__, self.function.__qualname__)
+
+    def __call__(self, data, parameters, copy=False):
+        args = [data[i] for i in self.inputs]
+        if self.inplace and copy:
+            args = [a.copy() if isinstance(a, np.ndarray) else a for a in args]
+        args += [parameters[p] for p in self.parameters]
+        result = self.function(*args)
+        if len(self.outputs) == 1:
+            result = (result,)
+        return dict(zip(self.outputs, result))
+
+
+class StageCache():
+    '''
+        Least recently used memory of stage outputs. Cached images are made
+        read-only, so that nothing downstream can change them by accident.
+        Outputs that are being computed by one thread are waited for by the
+        other threads instead of being computed again.
+    '''
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        for v in value.values():
+            if isinstance(v, np.ndarray):
+                v.flags.writeable = False
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def compute(self, key, function):
+        '''
+        The cached value of key, or the value returned by function, which is
+        then cached. If another thread is already computing the value of the
+        same key, its result is used.
+
+        Parameters
+        ----------
+        key : hashable
+            The cache key.
+        function : function
+            Called without arguments to compute the value.
+
+        Returns
+        -------
+        value
+            The value of key.
+
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self.pending[key] = Future()
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+        try:
+            value = function()
+            self.put(key, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class Pipeline():
+    '''
+        An ordered list of stages. With a StageCache the output of every stage
+        is memoized, keyed by the frame, the implementation of the stage and
+        of all stages before it and the parameters they depend on. The time
+        spent in every stage is accumulated in timings.
+    '''
+
+    def __init__(self, stages, cache=None):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        stages : list
+            The Stage objects in the order they are run.
+        cache : StageCache, optional
+            Memory for the stage outputs. None, the default, disables caching.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.stages = list(stages)
+        self.cache = cache
+        self.timings = OrderedDict((stage.name, [0., 0]) for stage in self.stages)
+        self.lock = threading.Lock()
+
+    def replace(self, name, stage):
+        '''
+        Replace the stage with the given name by an alternative implementation.
+        '''
+        for i, s in enumerate(self.stages):
+            if s.name == name:
+                self.stages[i] = stage
+                return
+        raise KeyError('The pipeline has no stage %s'%name)
+
+    def frameKey(self, img):
+        '''
+        Hash of the frame content used as cache key.
+        '''
+        return hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16).hexdigest()
+
+    def resetTimings(self):
+        '''
+        Start the timings and the cache statistics from zero, for example
+        for the next run of a pipeline that is reused.
+        '''
+        with self.lock:
+            self.timings = OrderedDict((stage.name, [0., 0]) for stage in self.stages)
+            if self.cache is not None:
+                self.cache.hits = 0
+                self.cache.misses = 0
+
+    def addTiming(self, name, seconds, calls=1):
+        '''
+        Add time spent in a stage, also for work done outside the pipeline.
+        '''
+        with self.lock:
+            timing = self.timings.setdefault(name, [0., 0])
+            timing[0] += seconds
+            timing[1] += calls
+
+    def run(self, img, parameters, key=None, stop=None):
+        '''
+        Run the stages on a frame.
+
+        Parameters
+        ----------
+        img : array_like
+            The stretched grayscale frame.
+        parameters : dictionary
+            The run parameters the stages depend on.
+        key : string, optional
+            Cache key of the frame, for example its name. The frame content is
+            hashed if no key is given and a cache is used.
+        stop : string, optional
+            Name of the last stage to run. All stages are run by default.
+
+        Returns
+        -------
+        data : dictionary
+            The frame and the outputs of all stages that were run.
+
+        '''
+        data = {'img': img}
+        if self.cache is not None and key is None:
+            key = self.frameKey(img)
+        for stage in self.stages:
+            def compute(stage=stage, data=data):
+                start = time.perf_counter()
+                output = stage(data, parameters, copy=self.cache is not None)
+                self.addTiming(stage.name, time.perf_counter() - start)
+                return output
+
+            if self.cache is not None:
+                key = hash((key, stage.name, stage.identity(),
+                            tuple(parameters[p] for p in stage.parameters)))
+                output = self.cache.compute(key, compute)
+            else:
+                output = compute()
+            data.update(output)
+            if stage.name == stop:
+                break
+        return data
+
+    def segment(self, img, parameters, key=None):
+        '''
+        Run all stages, same output as functions.segmentDroplets.
+
+        Returns
+        -------
+        thresh, droplets_outer, droplets_inner, beads : array_like
+            See functions.segmentDroplets. The images are copies when a cache
+            is used, so they can be changed.
+
+        '''
+        data = self.run(img, parameters, key)
+        result = [data['thresh'], data['droplets_outer'], data['droplets_inner'], data['beads']]
+        if self.cache is not None:
+            result = [r.copy() for r in result]
+        return tuple(result)
+
+    def printTimings(self):
+        '''
+        Print the total and mean time spent in every stage.
+        '''
+        for name, (total, count) in self.timings.items():
+            if count > 0:
+                print('%-12s %8.3f s total %8.2f ms per call (%d calls)'
+                      %(name, total, 1000*total/count, count))
+        if self.cache is not None:
+            print('Stage cache: %d hits, %d misses'%(self.cache.hits, self.cache.misses))
+
+
+def segmentationPipeline(cache=None):
+    '''
+    The stages of functions.segmentDroplets as a pipeline.
+
+    Parameters
+    ----------
+    cache : StageCache, optional
+        Memory for the stage outputs. None, the default, disables caching.
+
+    Returns
+    -------
+    Pipeline
+        The segmentation pipeline.
+
+    '''
+    stages = [Stage('laplacian', laplacianImage, ['img'], [], ['lapl', 'm']),
+              Stage('threshold', thresholdLaplacian, ['lapl', 'm'], ['offset'], ['thresh']),
+              Stage('filter', removeSmallObjects, ['thresh'], ['beadMin'], ['thresh'],
+                    inplace=True),
+              Stage('morphology', closeEdges, ['thresh'], [], ['thresh']),
+              Stage('classify', classifyObjects, ['thresh'],
+                    ['beadMin', 'beadMax', 'dropMin', 'dropMax'],
+                    ['droplets_outer', 'droplets_inner', 'beads']),
+              Stage('refine', refineDroplets, ['droplets_outer', 'droplets_inner', 'beads'],
+                    ['dropMin', 'dropMax'],
+                    ['droplets_outer', 'droplets_inner', 'beads'])]
+    return Pipeline(stages, cache)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import json, time, sqlite3
+from pathlib import Path
+
+schema = '''
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    folder TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    outputfolder TEXT,
+    frames INTEGER,
+    started TEXT,
+    completed TEXT,
+    parameters TEXT
+);
+CREATE TABLE IF NOT EXISTS frames (
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    frame_number INTEGER NOT NULL,
+    frame TEXT NOT NULL,
+    droplets INTEGER,
+    truncated INTEGER,
+    skipped INTEGER,
+    time REAL,
+    PRIMARY KEY (folder_id, frame_number)
+);
+CREATE TABLE IF NOT EXISTS droplets (
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    frame_number INTEGER NOT NULL,
+    frame TEXT NOT NULL,
+    droplet INTEGER NOT NULL,
+    r_mean REAL, r_med REAL, r_std REAL, r_max REAL, r_min REAL,
+    area REAL, major_axis REAL, minor_axis REAL,
+    center_x INTEGER, center_y INTEGER,
+    time REAL,
+    beads INTEGER
+);
+CREATE INDEX IF NOT EXISTS droplets_frame ON droplets (folder_id, frame_number);
+CREATE INDEX IF NOT EXISTS droplets_area ON droplets (area);
+CREATE INDEX IF NOT EXISTS droplets_r_med ON droplets (r_med);
+CREATE INDEX IF NOT EXISTS folders_name ON folders (name);
+'''
+
+class ResultsIndex():
+    '''
+        SQLite database with the droplets and frames of all runs, indexed by
+        folder, frame and droplet size, so that results of many folders can
+        be queried and checked for completeness without reading the tables.
+    '''
+
+    def __init__(self, filename, timeout=60):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        filename : Path
+            The database file, it is created if it does not exist.
+        timeout : float, optional
+            Seconds to wait for other processes writing to the database.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.filename = Path(filename)
+        self.connection = sqlite3.connect(str(self.filename), timeout=timeout,
+                                          check_same_thread=False)
+        self.connection.executescript(schema)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def beginFolder(self, folder, name, outputfolder, frames, parameters,
+                    first_frame=0, end_frame=None):
+        '''
+        Register a run of a folder. Earlier results of the frames that are
+        segmented again are removed.
+
+        Parameters
+        ----------
+        folder : Path
+            The folder, TIFF stack or video.
+        name : string
+            The name of the folder.
+        outputfolder : Path
+            The folder where the result tables are saved.
+        frames : integer
+            The number of frames in the folder.
+        parameters : dictionary
+            The run parameters.
+        first_frame, end_frame : integer, optional
+            The range of frames of the run, all frames by default.
+
+        Returns
+        -------
+        folder_id : integer
+            The id of the folder in the index.
+
+        '''
+        end_frame = frames if end_frame is None else end_frame
+        folder = str(Path(folder).resolve())
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO folders (folder, name, outputfolder, frames, started, parameters) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(folder) DO UPDATE SET '
+                'name=excluded.name, outputfolder=excluded.outputfolder, frames=excluded.frames, '
+                'started=excluded.started, completed=NULL, parameters=excluded.parameters',
+                (folder, name, str(outputfolder), frames, time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 json.dumps({k: (str(v) if isinstance(v, Path) else v)
+                             for k, v in parameters.items()})))
+            folder_id = self.connection.execute('SELECT id FROM folders WHERE folder=?',
+                                                (folder,)).fetchone()[0]
+            for table in ['frames', 'droplets']:
+                self.connection.execute('DELETE FROM %s WHERE folder_id=? AND frame_number>=? '
+                                        'AND frame_number<?'%table,
+                                        (folder_id, first_frame, end_frame))
+        return folder_id
+
+    def addFrame(self, folder_id, frame_number, frame, drop_array, truncated=0,
+                 skipped=False, timestamp=None):
+        '''
+        Add a frame and its droplets. The rows are committed by
+        endFolder or commit.
+        '''
+        self.connection.execute('INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (folder_id, frame_number, frame, len(drop_array), truncated,
+                                 int(skipped), timestamp))
+        self.connection.executemany(
+            'INSERT INTO droplets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(folder_id, frame_number, frame, i, float(drop.rMean), float(drop.rMed),
+              float(drop.rStd), float(drop.rMax), float(drop.rMin), float(drop.area),
+              float(drop.majorAxis), float(drop.minorAxis), int(drop.positionX),
+              int(drop.positionY), timestamp, len(drop.beads))
+             for i, drop in enumerate(drop_array)])
+
+    def commit(self):
+        self.connection.commit()
+
+    def endFolder(self, folder_id):
+        '''
+        Commit the frames of a run and mark the folder as completed if all
+        its frames are in the index.
+        '''
+        self.connection.commit()
+        if self.isComplete(folder_id=folder_id):
+            with self.connection:
+                self.connection.execute('UPDATE folders SET completed=? WHERE id=?',
+                                        (time.strftime('%Y-%m-%dT%H:%M:%S'), folder_id))
+
+    def folderId(self, folder=None, name=None):
+        '''
+        Id of a folder given by its path or name, None if it is not indexed.
+        '''
+        if folder is not None:
+            row = self.connection.execute('SELECT id FROM folders WHERE folder=?',
+                                          (str(Path(folder).resolve()),)).fetchone()
+        else:
+            row = self.connection.execute('SELECT id FROM folders WHERE name=?',
+                                          (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def frameCount(self, folder_id):
+        '''
+        The number of frames of a folder in the index and the highest frame
+        number.
+        '''
+        return self.connection.execute('SELECT COUNT(*), MAX(frame_number) FROM frames '
+                                       'WHERE folder_id=?', (folder_id,)).fetchone()
+
+    def isComplete(self, folder=None, name=None, folder_id=None):
+        '''
+        Check if all frames of a folder are in the index.
+        '''
+        if folder_id is None:
+            folder_id = self.folderId(folder, name)
+            if folder_id is None:
+                return False
+        frames = self.connection.execute('SELECT frames FROM folders WHERE id=?',
+                                         (folder_id,)).fetchone()[0]
+        return self.frameCount(folder_id)[0] == frames
+
+    def folders(self):
+        '''
+        All indexed folders with their number of frames, frames in the index,
+        droplets and completion time.
+        '''
+        return self.connection.execute(
+            'SELECT f.name, f.folder, f.frames, '
+            '(SELECT COUNT(*) FROM frames WHERE folder_id=f.id), '
+            '(SELECT COUNT(*) FROM droplets WHERE folder_id=f.id), f.completed '
+            'FROM folders f ORDER BY f.folder').fetchall()
+
+    def droplets(self, name=None, minArea=None, maxArea=None, columns='*'):
+        '''
+        Query the droplets, optionally of a single folder and within a range
+        of areas.
+
+        Parameters
+        ----------
+        name : string, optional
+            The name of the folder.
+        minArea, maxArea : float, optional
+            The range of the droplet area.
+        columns : string, optional
+            The columns to return, all by default.
+
+        Returns
+        -------
+        list
+            The rows of the droplets.
+
+        '''
+        conditions = []
+        values = []
+        if name is not None:
+            conditions.append('folder_id IN (SELECT id FROM folders WHERE name=?)')
+            values.append(name)
+        if minArea is not None:
+            conditions.append('area>=?')
+            values.append(minArea)
+        if maxArea is not None:
+            conditions.append('area<=?')
+            values.append(maxArea)
+        query = 'SELECT %s FROM droplets'%columns
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return self.connection.execute(query, values).fetchall()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import os, time, tempfile
+from contextlib import ExitStack
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from framesource import open_frame_source, prefetch, orderedMap
+from framecache import FrameCache
+from functions import seperateBeadsFromBorder, seperateSingleBeads, extractDroplets
+from functions import cropFrame, stretchFrame, assignBeads, downsampleFrame, changedFraction
+from functions import medianFrame
+from pipeline import segmentationPipeline
+from params import resolveParameters, writeManifest
+from summary import DropletSummary
+from resultsindex import ResultsIndex
+from cropexport import CropWriter
+
+table_header = 'Img_num;Droplet_number;R_mean;R_med;R_std;R_max;R_min;Area;Major_axis;Minor_axis;center_x;center_y;time;Beads\n'
+frame_header = 'Img_num;Droplets;Truncated;time;Skipped\n'
+bead_header = ('Img_num;Droplet_number;center_x;center_y;Beads;Area;'
+               'Blue_mean;Green_mean;Red_mean;Blue_med;Green_med;Red_med;'
+               'H_mean;S_mean;V_mean;H_med;S_med;V_med\n')
+# row i describes crop i of the crop file, x and y are in the uncropped frame
+crop_header = 'Img_num;Droplet_number;center_x;center_y;x;y;side\n'
+
+def tableRow(drop, number, time=None, sep=';'):
+    '''
+    Line of the result table for a droplet.
+
+    Parameters
+    ----------
+    drop : Droplet
+        The droplet.
+    number : integer
+        The number of the droplet in its image.
+    time : float, optional
+        Acquisition time of the image in seconds, left empty if not known.
+    sep : string, optional
+        The column separator.
+
+    Returns
+    -------
+    string
+        The separated line.
+
+    '''
+    values = [drop.imageNumber, number, drop.rMean, drop.rMed, drop.rStd, drop.rMax,
+              drop.rMin, drop.area, drop.majorAxis, drop.minorAxis, drop.positionX,
+              drop.positionY, '' if time is None else time, len(drop.beads)]
+    return sep.join(str(v) for v in values) + '\n'
+
+
+class DropletSegmenter():
+    '''
+        The droplet segmentation configured once from a parameter dictionary,
+        with the same keys as the JSON parameter file. segment() finds the
+        droplets in a single frame and run() processes a whole folder, TIFF
+        stack or video like the command line script.
+    '''
+
+    def __init__(self, parameters, verbose=True):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        parameters : dictionary
+            The run parameters. Missing parameters are set to their default
+            values, see params.schema.
+        verbose : bool, optional
+            Show a message for every parameter set to its default value.
+
+        Returns
+        -------
+        None.
+
+        '''
+        resolved, errors = resolveParameters(parameters, verbose, requireFolders=False)
+        if errors:
+            raise ValueError('; '.join(errors))
+        self.parameters = resolved
+
+        # area of bead clusters with [1,2,3,4] beads. Learned from data using k-means clustering
+        # as long, as the resolution doesn't change, this should hold true
+        self.clumpsizes = np.array([238, 456, 660, 1000])
+
+        # values for image cropping
+        self.cutTop = resolved['cutTop']
+        self.cutBottom = resolved['cutBottom']
+
+        # values for accepted droplet and bead sizes (areas)
+        # seperator = value for seperation of single beads and clusters
+        self.dropMin = resolved['dropMin']
+        self.dropMax = resolved['dropMax']
+        self.offset = resolved['offset']
+        self.beadMin = resolved['beadMin']
+        self.beadMax = resolved['beadMax']
+        self.seperator = 300
+        # droplet features from the full contours or from simplified polygons
+        self.featurePrecision = resolved['feature precision']
+        self.contourEpsilon = resolved['contour epsilon']
+
+        # frames where less than this fraction of the downsampled pixels differ
+        # from the background are empty channel and not segmented
+        self.skipThreshold = resolved['skip threshold']
+        self.skipFactor = 4
+        self.skipLevel = 16
+
+        # should result images with drawn contours be saved
+        # if so, every saveImagesNumber-th image will be saved
+        self.saveImages = resolved['save images']
+        self.saveMasks = resolved['save masks']
+        self.saveImagesNumber = resolved['save every x image']
+        self.n_bg = resolved['n bg']
+        # the background frames are spread over the source or the first frames
+        self.bgSampling = resolved['bg sampling']
+        # colour of the beads for colour-coded assays
+        self.beadColors = resolved['bead colors']
+        # cropped grayscale frames can be cached on a local disk for repeated runs
+        self.cachefolder = resolved['frame cache']
+
+        # frames are decoded ahead and segmented by several threads
+        self.workers = resolved['workers']
+        self.prefetch = resolved['prefetch']
+        # csv tables are semicolon, tsv tables tab separated
+        self.extension = '.' + resolved['output format']
+        self.separator = ';' if resolved['output format'] == 'csv' else '\t'
+        self.manifest = resolved['manifest']
+        self.hashInputs = resolved['hash inputs']
+        # droplet counts and size distributions updated during the run
+        self.summary = resolved['summary']
+        self.summaryInterval = resolved['summary interval']
+        # SQLite database the droplets of all runs are added to
+        self.resultsIndex = resolved['results index']
+        # fixed size crops of every droplet for training classifiers
+        self.cropSize = resolved['crop size']
+        self.cropMode = resolved['crop mode']
+
+        # the stages of segmentDroplets, timed individually
+        self.pipeline = segmentationPipeline()
+        self.segmentation_parameters = {'beadMin': self.beadMin, 'beadMax': self.beadMax,
+                                        'dropMin': self.dropMin, 'dropMax': self.dropMax,
+                                        'offset': self.offset}
+        self.bg_small = None
+
+    def background(self, source, frames=None):
+        '''
+        Median background of 'n bg' frames, cropped and inverted so that it
+        can be added to a frame. The frames are spread evenly over the whole
+        source, or are the first frames if 'bg sampling' is 'first'. They are
+        decoded in parallel into a temporary file and the median is computed
+        in blocks of rows, so the memory does not grow with 'n bg'.
+
+        Parameters
+        ----------
+        source : FrameSource
+            The frames of the run.
+        frames : FrameCache, optional
+            Cached cropped grayscale frames of the source.
+
+        Returns
+        -------
+        bg : array_like
+            The inverted background image.
+
+        '''
+        n = min(self.n_bg, len(source))
+        if self.bgSampling == 'spread':
+            # the whole source and not only the frames of the run, so that
+            # all parts of a split folder use the same background
+            indices = np.unique(np.linspace(0, len(source) - 1, n).round().astype(int))
+        else:
+            indices = np.arange(n)
+
+        if frames is not None:
+            with open(frames.datafile, 'rb') as stackfile:
+                bg = medianFrame(stackfile, frames.shape, indices)
+        else:
+            def read(im):
+                return cv2.cvtColor(cropFrame(source[im], self.cutTop, self.cutBottom),
+                                    cv2.COLOR_BGR2GRAY)
+
+            workers = self.workers or os.cpu_count()
+            pool = None
+            if workers > 1 and source.threadSafe:
+                pool = ThreadPoolExecutor(workers)
+            # the decoded frames are written to a temporary file, so that the
+            # memory does not grow with the number of frames
+            with tempfile.TemporaryFile() as tmp:
+                shape = None
+                try:
+                    for img in orderedMap(pool, read, indices, 2*workers):
+                        shape = img.shape
+                        tmp.write(np.ascontiguousarray(img, dtype=np.uint8).tobytes())
+                finally:
+                    if pool is not None:
+                        pool.shutdown()
+                tmp.flush()
+                bg = medianFrame(tmp, (len(indices),) + shape)
+        bg = bg.astype(np.uint8)
+        bg = 255 - bg
+        return bg
+
+    def isEmpty(self, img1):
+        '''
+        Check if a frame can be skipped because it does not differ from the
+        background, see functions.changedFraction.
+
+        Parameters
+        ----------
+        img1 : array_like
+            The cropped grayscale frame.
+
+        Returns
+        -------
+        bool
+            True if the frame is empty, always False if skipping is off or no
+            background has been computed.
+
+        '''
+        if self.skipThreshold <= 0 or self.bg_small is None:
+            return False
+        return changedFraction(img1, self.bg_small, self.skipFactor,
+                               self.skipLevel) < self.skipThreshold
+
+    def segmentFrame(self, img1, imgname, img_rgb=None):
+        '''
+        Segment the droplets and bead clusters of a cropped grayscale frame.
+
+        Parameters
+        ----------
+        img1 : array_like
+            The cropped grayscale frame.
+        imgname : string
+            The name of the frame.
+        img_rgb : array_like, optional
+            The cropped colour frame, the colour of the beads is measured if
+            it is given.
+
+        Returns
+        -------
+        drop_array : list
+            The Droplet objects found in the frame.
+        drop_outer : array_like
+            Mask of the droplets.
+        bead_objects : list
+            The bead objects in the droplets, see functions.assignBeads.
+        truncated : array_like
+            The droplet sized objects removed for touching the image border,
+            see functions.extractDroplets.
+
+        '''
+        img = stretchFrame(img1)
+
+        ### Segment droplets and bead clusters ###
+
+        # thresh is the thresholded image after Laplacian of Gaussian
+        # drop outer contains outer borders of droplets
+        # drop_inner contains inner borders
+        # beads contains beads inside droplets
+        thresh, drop_outer, drop_inner, beads = self.pipeline.segment(img, self.segmentation_parameters)
+        drop_inner, beads = seperateBeadsFromBorder(drop_inner, beads,
+                                                    self.beadMin, imgname)
+
+        beads, clumps = seperateSingleBeads(beads, self.seperator)
+
+        contours, hierarchy = cv2.findContours(clumps.copy(),
+                                               cv2.RETR_EXTERNAL,
+                                               cv2.CHAIN_APPROX_SIMPLE)
+        for i, cnt in enumerate(contours):
+            area = cv2.contourArea(cnt)
+            if area > self.clumpsizes[0]:
+                cv2.drawContours(clumps, [cnt], -1, 1, -1)
+
+        drop_array, truncated = extractDroplets(drop_outer, imgname, self.dropMin, self.cutTop,
+                                                self.featurePrecision, self.contourEpsilon)
+
+        # bead counts per droplet, clusters are counted from their area
+        counts, bead_objects = assignBeads(beads, clumps, drop_array, self.clumpsizes,
+                                           self.cutTop, img_rgb)
+
+        return drop_array, drop_outer, bead_objects, truncated
+
+    def segment(self, frame, imgname='frame'):
+        '''
+        Find the droplets in a single frame.
+
+        Parameters
+        ----------
+        frame : array_like
+            The uncropped frame as BGR or grayscale image.
+        imgname : string, optional
+            The name of the frame stored in the droplets.
+
+        Returns
+        -------
+        drop_array : list
+            The Droplet objects found in the frame.
+
+        '''
+        frame = cropFrame(frame, self.cutTop, self.cutBottom)
+        img_rgb = None
+        if frame.ndim == 3:
+            if self.beadColors:
+                img_rgb = frame
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return self.segmentFrame(frame, imgname, img_rgb)[0]
+
+    def run(self, inputfolder, outputfolder, frames=None, name=None):
+        '''
+        Segment all frames of a folder, TIFF stack or video. The droplets are
+        written to <foldername>.csv in the output folder together with the
+        segmentation images and masks if these are to be saved. Frames are
+        decoded ahead in a background thread and segmented by 'workers'
+        threads, the outputs are written in frame order. The parameters,
+        inputs and timing of the run are saved in <foldername>_manifest.json.
+        The manifest of a frame range lists the inputs of these frames and
+        does not hash them, the parts of a folder are hashed once when they
+        are merged.
+
+        Parameters
+        ----------
+        inputfolder : Path
+            The folder, TIFF stack or video.
+        outputfolder : Path
+            The folder where the results are saved.
+        frames : tuple, optional
+            The first and the end frame number, only these frames are
+            segmented. All frames by default.
+        name : string, optional
+            Replaces the folder name in the names of the output files.
+
+        Returns
+        -------
+        n_droplets : integer
+            The number of droplets found.
+
+        '''
+        start = time.perf_counter()
+        # the segmenter is reused by the service and the workers, the
+        # manifest only holds the stage timings of this run
+        self.pipeline.resetTimings()
+        outputfolder = Path(outputfolder)
+        if not outputfolder.exists():
+            outputfolder.mkdir(parents=True)
+        print(str(inputfolder).replace('\\','/'))
+        # the files, the frame source and the index are closed also when a
+        # frame fails, so the long-lived service does not leak them
+        with ExitStack() as stack:
+            # a folder of images, a multi-page TIFF or a video
+            source = stack.enter_context(open_frame_source(inputfolder))
+            foldername = source.name if name is None else name
+            first_frame, end_frame = (0, len(source)) if frames is None else frames
+            end_frame = min(end_frame, len(source))
+            n_frames = end_frame - first_frame
+            print('%d frames in %s'%(len(source), source.name))
+
+            cache = None
+            if self.cachefolder:
+                try:
+                    # a frame range uses an existing cache, but does not
+                    # decode the whole source to build it
+                    cache = FrameCache(self.cachefolder, source, self.cutTop, self.cutBottom,
+                                       build=frames is None)
+                except FileNotFoundError:
+                    print('No frame cache for %s, the frames of the range are decoded'%source.name)
+            if cache is not None:
+                original_shape = cache.original_shape
+            else:
+                first = source[0]
+                original_shape = [first.shape[0], first.shape[1]]
+
+            ############## Generate averaged background image for the empty frames ###############
+            # the segmentation uses the stretched frames without the
+            # background, it is only needed to find empty frames
+            self.bg_small = None
+            if self.skipThreshold > 0:
+                bg = self.background(source, cache)
+                self.bg_small = downsampleFrame(255 - bg, self.skipFactor)
+            bg_time = time.perf_counter() - start
+
+            ####################### Loop for single image segmentation ###########################
+            def read():
+                for im in range(first_frame, end_frame):
+                    if cache is not None:
+                        img1 = cache[im]
+                        img_rgb = cv2.cvtColor(img1, cv2.COLOR_GRAY2BGR)
+                    else:
+                        img_rgb = cropFrame(source[im], self.cutTop, self.cutBottom)
+                        img1 = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY)
+                    color = None
+                    if self.beadColors:
+                        color = img_rgb
+                        if cache is not None:
+                            color = cropFrame(source[im], self.cutTop, self.cutBottom)
+                    yield im, source.frameName(im), source.timestamp(im), img1, img_rgb, color
+
+            def process(frame):
+                im, imgname, timestamp, img1, img_rgb, color = frame
+                if self.isEmpty(img1):
+                    return frame, None
+                return frame, self.segmentFrame(img1, imgname, color)
+
+            sep = self.separator
+            workers = self.workers or os.cpu_count()
+            n_droplets = 0
+            n_skipped = 0
+            outfile = outputfolder/(foldername+self.extension)
+            framefile = stack.enter_context(open(outputfolder/(foldername+'_frames'+self.extension), 'w'))
+            framefile.write(frame_header.replace(';', sep))
+            if self.beadColors:
+                beadfile = stack.enter_context(open(outputfolder/(foldername+'_beads'+self.extension), 'w'))
+                beadfile.write(bead_header.replace(';', sep))
+                if cache is not None:
+                    print('Bead colours are measured in the original frames, not the frame cache')
+            summary = None
+            if self.summary:
+                summary = DropletSummary(outputfolder/(foldername+'_summary.json'),
+                                         self.dropMin, self.dropMax, self.summaryInterval)
+            index = None
+            if self.resultsIndex:
+                index = stack.enter_context(ResultsIndex(self.resultsIndex))
+                folder_id = index.beginFolder(inputfolder, source.name, outputfolder, len(source),
+                                              self.parameters, first_frame, end_frame)
+            crops = None
+            if self.cropSize:
+                crops = stack.enter_context(CropWriter(outputfolder/(foldername+'_crops.npy'),
+                                                       self.cropSize, self.cropMode))
+                cropfile = stack.enter_context(open(outputfolder/(foldername+'_crops'+self.extension), 'w'))
+                cropfile.write(crop_header.replace(';', sep))
+            segmentation_start = time.perf_counter()
+            with open(outfile, 'w') as f, ThreadPoolExecutor(workers) as pool:
+                f.write(table_header.replace(';', sep))
+                # the reading thread is stopped before the files and the source
+                # are closed, also when a frame fails
+                ahead = prefetch(read(), self.prefetch)
+                stack.callback(ahead.close)
+                results = orderedMap(pool if workers > 1 else None, process, ahead, 2*workers)
+                for frame, result in results:
+                    im, imgname, timestamp, img1, img_rgb, color = frame
+                    skipped = result is None
+                    if skipped:
+                        # empty frames are recorded without droplets
+                        n_skipped += 1
+                        result = [], np.zeros_like(img1), [], []
+                    drop_array, drop_outer, bead_objects, truncated = result
+
+                    ##################################### Output ##################################
+                    for i, drop in enumerate(drop_array):
+                        f.write(tableRow(drop, i, timestamp, sep))
+                    n_droplets += len(drop_array)
+                    framefile.write(sep.join([imgname, str(len(drop_array)), str(len(truncated)),
+                                              '' if timestamp is None else str(timestamp),
+                                              str(int(skipped))]) + '\n')
+                    if self.beadColors:
+                        for obj in bead_objects:
+                            # same coordinates as the droplet centers
+                            obj[2] += self.cutTop
+                            beadfile.write(imgname + sep + sep.join(str(v) for v in obj) + '\n')
+                    if crops is not None:
+                        for i, drop in enumerate(drop_array):
+                            x, y, side = crops.add(img1, drop.contour)
+                            cropfile.write(sep.join(str(v) for v in [imgname, i, drop.positionX,
+                                                                     drop.positionY, x,
+                                                                     y + self.cutTop, side]) + '\n')
+                    if summary is not None:
+                        summary.add(drop_array, len(truncated), timestamp, skipped)
+                    if index is not None:
+                        index.addFrame(folder_id, im, imgname, drop_array, len(truncated),
+                                       skipped, timestamp)
+
+                    if self.saveImages:
+                        if im%self.saveImagesNumber == 0:
+                            drawing = img_rgb.copy()
+                            for drop in drop_array:
+                                cv2.drawContours(drawing, [drop.contour], -1, (0, 0, 255), 1)
+                            cv2.imwrite(str(outputfolder/(imgname+'_contour.png')), drawing)
+                    if self.saveMasks:
+                        maskFolder = outputfolder / 'Masks'
+                        if not maskFolder.exists():
+                            maskFolder.mkdir()
+                        if im%self.saveImagesNumber == 0:
+                            mask = np.zeros(original_shape)
+                            cropFrame(mask, self.cutTop, self.cutBottom)[:] = drop_outer
+                            cv2.imwrite(str(maskFolder/(imgname+'.png')), mask)
+
+                    if im%50 == 0:
+                        print("Image: ", im)
+                        if index is not None:
+                            # other processes can write between the commits
+                            index.commit()
+
+            if summary is not None:
+                summary.write(final=True)
+            if index is not None:
+                index.endFolder(folder_id)
+            self.pipeline.printTimings()
+
+            end = time.perf_counter()
+            timing = {'background_seconds': bg_time,
+                      'segmentation_seconds': end - segmentation_start,
+                      'total_seconds': end - start,
+                      'frames_per_second': n_frames/max(end - segmentation_start, 1e-9),
+                      'workers': workers,
+                      'skipped_frames': n_skipped,
+                      'stages': {name: {'seconds': t, 'calls': n}
+                                 for name, (t, n) in self.pipeline.timings.items()}}
+            print('%d frames in %.1f s, %.1f frames/s'%(n_frames, timing['total_seconds'],
+                                                      timing['frames_per_second']))
+            if self.skipThreshold > 0:
+                print('%d of %d frames skipped as empty'%(n_skipped, n_frames))
+            if self.manifest:
+                writeManifest(outputfolder/(foldername+'_manifest.json'), self.parameters,
+                              source, timing, workers, self.hashInputs and frames is None,
+                              None if frames is None else (first_frame, end_frame))
+            return n_droplets
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import sys, json, time
+from contextlib import redirect_stdout
+import cv2
+from segmenter import DropletSegmenter
+
+def dropletToDict(drop):
+    '''
+    The features of a droplet as a JSON serialisable dictionary.
+    '''
+    return {'image': drop.imageNumber,
+            'area': float(drop.area),
+            'center_x': int(drop.positionX),
+            'center_y': int(drop.positionY),
+            'R_mean': float(drop.rMean),
+            'R_med': float(drop.rMed),
+            'R_std': float(drop.rStd),
+            'R_min': float(drop.rMin),
+            'R_max': float(drop.rMax),
+            'major_axis': float(drop.majorAxis),
+            'minor_axis': float(drop.minorAxis),
+            'beads': len(drop.beads)}
+
+class Service():
+    '''
+        Long-lived segmentation service that keeps the imaging libraries
+        loaded and the segmenter configured between jobs.
+    '''
+
+    def __init__(self, parameters=None):
+        self.parameters = dict(parameters or {})
+        self.segmenter = None
+        self.configured = None
+
+    def getSegmenter(self, parameters=None):
+        '''
+        Segmenter for the base parameters updated with the job parameters. The
+        segmenter is only rebuilt when the parameters change.
+        '''
+        current = dict(self.parameters)
+        current.update(parameters or {})
+        if self.segmenter is None or current != self.configured:
+            self.segmenter = DropletSegmenter(current)
+            self.configured = current
+        return self.segmenter
+
+    def handle(self, request):
+        '''
+        Handle a single request.
+
+        Parameters
+        ----------
+        request : dictionary
+            The request with a 'command' and its arguments.
+
+        Returns
+        -------
+        response : dictionary
+            The response, 'status' is 'ok' or 'error'.
+
+        '''
+        command = request.get('command')
+        if command == 'configure':
+            parameters = dict(request.get('parameters', {}))
+            # invalid parameters are reported here and not by the next job,
+            # the old parameters are kept
+            self.segmenter = DropletSegmenter(parameters)
+            self.parameters = parameters
+            self.configured = dict(parameters)
+            response = {'status': 'ok'}
+        elif command == 'run':
+            segmenter = self.getSegmenter(request.get('parameters'))
+            n = segmenter.run(request['inputfolder'], request['outputfolder'])
+            response = {'status': 'ok', 'droplets': n}
+        elif command == 'segment':
+            segmenter = self.getSegmenter(request.get('parameters'))
+            frame = cv2.imread(str(request['image']))
+            if frame is None:
+                raise IOError('Image %s could not be read'%request['image'])
+            drop_array = segmenter.segment(frame, request.get('name', 'frame'))
+            response = {'status': 'ok',
+                        'droplets': [dropletToDict(drop) for drop in drop_array]}
+        elif command == 'ping':
+            response = {'status': 'ok'}
+        else:
+            raise ValueError('Unknown command %s'%str(command))
+        return response
+
+    def serve(self, instream=sys.stdin, outstream=sys.stdout):
+        '''
+        Read one JSON request per line from instream and write one JSON
+        response per line to outstream until the 'quit' command or the end of
+        the input. Messages printed during a job go to stderr.
+        '''
+        for line in instream:
+            line = line.strip()
+            if not line:
+                continue
+            # failed requests are timed as well
+            start = time.perf_counter()
+            try:
+                request = json.loads(line)
+                if request.get('command') == 'quit':
+                    break
+                with redirect_stdout(sys.stderr):
+                    response = self.handle(request)
+            except Exception as e:
+                response = {'status': 'error', 'message': '%s: %s'%(type(e).__name__, str(e))}
+            response['seconds'] = time.perf_counter() - start
+            outstream.write(json.dumps(response) + '\n')
+            outstream.flush()
+
+def serve(args):
+    '''
+    Start the service, the optional argument is a JSON parameter file with
+    the base parameters of all jobs.
+    '''
+    parameters = {}
+    if len(args) > 0:
+        with open(args[0]) as json_file:
+            parameters = json.load(json_file)
+    Service(parameters).serve()
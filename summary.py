@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import os, json, time, math
+import numpy as np
+
+def jsonValue(value):
+    '''
+    Replace nan and infinite numbers by None, they are not valid JSON.
+    '''
+    if isinstance(value, dict):
+        return {k: jsonValue(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [jsonValue(v) for v in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+class Welford():
+    '''
+        Running count, mean, variance, minimum and maximum of a stream of
+        values, without storing the values.
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        '''
+        Add a single value.
+        '''
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta/self.n
+        self.m2 += delta*(x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def variance(self):
+        '''
+        The sample variance, nan for less than two values.
+        '''
+        return self.m2/(self.n - 1) if self.n > 1 else math.nan
+
+    def std(self):
+        '''
+        The sample standard deviation.
+        '''
+        return math.sqrt(self.variance())
+
+    def toDict(self):
+        if self.n == 0:
+            return {'n': 0}
+        return {'n': self.n, 'mean': self.mean, 'std': self.std(),
+                'min': self.min, 'max': self.max}
+
+
+class Histogram():
+    '''
+        Histogram with fixed, equally wide bins between low and high. Values
+        outside the range are counted as underflow and overflow.
+    '''
+
+    def __init__(self, low, high, bins=50):
+        self.low = float(low)
+        self.high = float(high)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    def add(self, x):
+        '''
+        Add a single value.
+        '''
+        if x < self.low:
+            self.underflow += 1
+        elif x >= self.high:
+            self.overflow += 1
+        else:
+            self.counts[int((x - self.low)/(self.high - self.low)*len(self.counts))] += 1
+
+    def toDict(self):
+        return {'low': self.low, 'high': self.high, 'counts': self.counts.tolist(),
+                'underflow': self.underflow, 'overflow': self.overflow}
+
+
+class QuantileSketch():
+    '''
+        Quantiles of a stream of positive values with a bounded relative
+        error. The values are counted in logarithmic buckets, so the memory
+        only grows with the logarithm of the value range.
+    '''
+
+    def __init__(self, accuracy=0.01):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        accuracy : float, optional
+            The relative error of the quantiles. The default is 1%.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.gamma = (1 + accuracy)/(1 - accuracy)
+        self.logGamma = math.log(self.gamma)
+        self.buckets = {}
+        self.n = 0
+
+    def add(self, x):
+        '''
+        Add a single value, values that are not positive are ignored.
+        '''
+        if x <= 0:
+            return
+        k = math.ceil(math.log(x)/self.logGamma)
+        self.buckets[k] = self.buckets.get(k, 0) + 1
+        self.n += 1
+
+    def quantile(self, q):
+        '''
+        The q-quantile, nan if no values are added.
+        '''
+        if self.n == 0:
+            return math.nan
+        rank = q*(self.n - 1)
+        seen = 0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if seen > rank:
+                break
+        # the middle of the bucket in terms of the relative error
+        return 2*self.gamma**k/(self.gamma + 1)
+
+    def toDict(self, quantiles=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)):
+        return {str(q): self.quantile(q) for q in quantiles}
+
+
+class Measure():
+    '''
+        All aggregates of one droplet feature.
+    '''
+
+    def __init__(self, low, high, bins=50):
+        self.stats = Welford()
+        self.histogram = Histogram(low, high, bins)
+        self.sketch = QuantileSketch()
+
+    def add(self, x):
+        x = float(x)
+        self.stats.add(x)
+        self.histogram.add(x)
+        self.sketch.add(x)
+
+    def toDict(self):
+        summary = self.stats.toDict()
+        summary['quantiles'] = self.sketch.toDict()
+        summary['histogram'] = self.histogram.toDict()
+        return summary
+
+
+class DropletSummary():
+    '''
+        Droplet counts, throughput and size distributions of a run,
+        aggregated online from the frame loop. The summary is small and is
+        written as JSON file at regular intervals, so that it can be followed
+        during a live run without reading the droplet tables.
+    '''
+
+    def __init__(self, filename, dropMin, dropMax, interval=10):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        filename : Path
+            The JSON file the summary is written to.
+        dropMin : float
+            The minimal droplet area, the lower end of the histograms.
+        dropMax : float
+            The maximal droplet area, the upper end of the histograms.
+        interval : float, optional
+            The summary is written at most every interval seconds while
+            frames are added.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.filename = filename
+        self.interval = interval
+        rMin = math.sqrt(dropMin/math.pi)
+        rMax = math.sqrt(dropMax/math.pi)
+        self.area = Measure(dropMin, dropMax)
+        self.radius = Measure(rMin, rMax)
+        # volume of a sphere with radius R_med in cubic pixels, not the volume
+        # in pL of Droplet.volume, which needs the channel height and pixel size
+        self.sphereVolume = Measure(4/3*math.pi*rMin**3, 4/3*math.pi*rMax**3)
+        self.frames = 0
+        self.skipped = 0
+        self.droplets = 0
+        self.truncated = 0
+        self.firstTime = None
+        self.lastTime = None
+        self.start = time.perf_counter()
+        # the duration of the run, by default the time since the start
+        self.seconds = None
+        self.lastWrite = (self.start, 0)
+        self.rate = math.nan
+
+    def add(self, drop_array, truncated=0, timestamp=None, skipped=False):
+        '''
+        Add the droplets of a frame.
+
+        Parameters
+        ----------
+        drop_array : list
+            The Droplet objects of the frame.
+        truncated : integer, optional
+            The number of droplets removed for touching the image border.
+        timestamp : float, optional
+            Acquisition time of the frame in seconds.
+        skipped : bool, optional
+            True if the frame was skipped as empty.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.addFrame(len(drop_array), truncated, timestamp, skipped)
+        for drop in drop_array:
+            self.addDroplet(drop.area, drop.rMed)
+        if time.perf_counter() - self.lastWrite[0] >= self.interval:
+            self.write()
+
+    def addFrame(self, droplets, truncated=0, timestamp=None, skipped=False):
+        '''
+        Count a frame with its number of droplets, see add.
+        '''
+        self.frames += 1
+        self.skipped += int(skipped)
+        self.droplets += droplets
+        self.truncated += truncated
+        if timestamp is not None:
+            if self.firstTime is None:
+                self.firstTime = timestamp
+            self.lastTime = timestamp
+
+    def addDroplet(self, area, rMed):
+        '''
+        Add the size of a droplet to the distributions.
+        '''
+        self.area.add(area)
+        self.radius.add(rMed)
+        self.sphereVolume.add(4/3*math.pi*rMed**3)
+
+    def toDict(self, final=False):
+        '''
+        The summary as JSON serialisable dictionary.
+        '''
+        elapsed = time.perf_counter() - self.start if self.seconds is None else self.seconds
+        radius = self.radius.stats
+        summary = {'updated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'final': final,
+                   'frames': self.frames,
+                   'skipped_frames': self.skipped,
+                   'droplets': self.droplets,
+                   'truncated_droplets': self.truncated,
+                   'seconds': elapsed,
+                   'frames_per_second': self.frames/elapsed if elapsed > 0 else math.nan,
+                   'droplets_per_second': self.droplets/elapsed if elapsed > 0 else math.nan,
+                   'recent_droplets_per_second': self.rate,
+                   # coefficient of variation of the droplet radius
+                   'polydispersity': radius.std()/radius.mean if radius.n > 1 else math.nan,
+                   'area': self.area.toDict(),
+                   'R_med': self.radius.toDict(),
+                   'sphere_volume_px3': self.sphereVolume.toDict()}
+        if self.firstTime is not None and self.lastTime > self.firstTime:
+            summary['droplets_per_acquisition_second'] = (self.droplets/
+                                                          (self.lastTime - self.firstTime))
+        return summary
+
+    def write(self, final=False):
+        '''
+        Write the summary. The file is replaced in one step, so readers never
+        see a partly written summary.
+        '''
+        now = time.perf_counter()
+        last, droplets = self.lastWrite
+        if now > last:
+            self.rate = (self.droplets - droplets)/(now - last)
+        self.lastWrite = (now, self.droplets)
+        tmp = str(self.filename) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(jsonValue(self.toDict(final)), f, indent=1)
+        os.replace(tmp, self.filename)
+
+
+def readTable(filename, columns, sep=';'):
+    '''
+    The values of some columns of a result table, line by line.
+
+    Parameters
+    ----------
+    filename : Path
+        The table.
+    columns : list
+        The names of the columns.
+    sep : string, optional
+        The column separator.
+
+    Yields
+    ------
+    list
+        The values of the columns as strings.
+
+    '''
+    with open(filename) as f:
+        header = f.readline().rstrip('\n').split(sep)
+        indices = [header.index(column) for column in columns]
+        for line in f:
+            values = line.rstrip('\n').split(sep)
+            yield [values[i] for i in indices]
+
+def summaryFromTables(filename, dropletTable, frameTable, dropMin, dropMax, seconds=None, sep=';'):
+    '''
+    Summary of finished droplet and frame tables, for the folders that are
+    segmented in parts and merged afterwards.
+
+    Parameters
+    ----------
+    filename : Path
+        The JSON file the summary is written to.
+    dropletTable : Path
+        The droplet table with the Area and R_med columns.
+    frameTable : Path
+        The frame table.
+    dropMin, dropMax : float
+        The range of the droplet area histograms, see DropletSummary.
+    seconds : float, optional
+        The duration of the run, for example the sum over the parts.
+    sep : string, optional
+        The column separator of the tables.
+
+    Returns
+    -------
+    DropletSummary
+        The summary, it is not written yet.
+
+    '''
+    summary = DropletSummary(filename, dropMin, dropMax)
+    summary.seconds = seconds
+    for droplets, truncated, timestamp, skipped in readTable(
+            frameTable, ['Droplets', 'Truncated', 'time', 'Skipped'], sep):
+        summary.addFrame(int(droplets), int(truncated), float(timestamp) if timestamp else None,
+                         skipped == '1')
+    for area, rMed in readTable(dropletTable, ['Area', 'R_med'], sep):
+        summary.addDroplet(float(area), float(rMed))
+    return summary
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import os, itertools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from framesource import open_frame_source
+from framecache import FrameCache
+from functions import extractDroplets, cropFrame, stretchFrame
+from pipeline import segmentationPipeline, StageCache
+
+# parameters of segmentLaplacian that can be swept and their defaults
+sweep_parameters = {'offset': 4,
+                    'dropMin': 5000,
+                    'dropMax': 300000,
+                    'beadMin': 140,
+                    'beadMax': 20000}
+
+def parameterGrid(parameters):
+    '''
+    All combinations of the swept parameters.
+
+    Parameters
+    ----------
+    parameters : dictionary
+        The run parameters, where parameters['sweep'] maps parameter names to
+        lists of values. Parameters that are not swept keep their value from
+        the run parameters or their default.
+
+    Returns
+    -------
+    grid : list
+        One dictionary of segmentLaplacian parameters per combination.
+
+    '''
+    sweep = parameters['sweep']
+    for key in sweep.keys():
+        if key not in sweep_parameters:
+            raise ValueError('%s can not be swept, use one of %s'
+                             %(key, ', '.join(sweep_parameters.keys())))
+    values = []
+    for key, default in sweep_parameters.items():
+        if key in sweep:
+            values.append(list(sweep[key]))
+        else:
+            values.append([parameters.get(key, default)])
+    return [dict(zip(sweep_parameters.keys(), combination))
+            for combination in itertools.product(*values)]
+
+def evaluateCombination(pipeline, img, imgname, cutTop, combination, precision='full',
+                        epsilon=1.0):
+    '''
+    Segment the droplets of one frame for one parameter combination, with
+    the features computed with the given precision, see
+    droplets_class.contourFeatures.
+
+    Returns
+    -------
+    drop_array : list
+        The Droplet objects found in the frame.
+
+    '''
+    thresh, drop_outer, drop_inner, beads = pipeline.segment(img, combination, imgname)
+    return extractDroplets(drop_outer, imgname, combination['dropMin'], cutTop,
+                           precision, epsilon)[0]
+
+def runSweep(parameters):
+    '''
+    Run the segmentation for all combinations of the swept parameters. Every
+    frame is decoded and its Laplacian image computed once, only the
+    thresholding and filtering is done per combination, in parallel. Stage
+    outputs that do not depend on the swept parameters are shared between
+    combinations through the stage cache of the segmentation pipeline.
+    Droplet counts and sizes are saved per combination in
+    <foldername>_sweep.csv and every single droplet in
+    <foldername>_sweep_droplets.csv.
+
+    Parameters
+    ----------
+    parameters : dictionary
+        The run parameters including 'sweep'.
+
+    Returns
+    -------
+    None.
+
+    '''
+    outputfolder = parameters['outputfolder']
+    if not outputfolder.exists():
+        outputfolder.mkdir(parents=True)
+    cutTop = parameters.get('cutTop', 40)
+    cutBottom = parameters.get('cutBottom', -60)
+    workers = parameters.get('workers') or os.cpu_count()
+    precision = parameters.get('feature precision', 'full')
+    epsilon = parameters.get('contour epsilon', 1.0)
+
+    grid = parameterGrid(parameters)
+    print('Sweeping %d parameter combinations'%len(grid))
+
+    pipeline = segmentationPipeline(StageCache(maxsize=16*len(grid)))
+
+    areas = [[] for c in grid]
+    radii = [[] for c in grid]
+    dropframes = np.zeros(len(grid), dtype=int)
+
+    # the source is closed also when a frame fails
+    with open_frame_source(parameters['inputfolder']) as source:
+        foldername = source.name
+        frames = None
+        if parameters.get('frame cache'):
+            frames = FrameCache(parameters['frame cache'], source, cutTop, cutBottom)
+        with open(outputfolder/(foldername+'_sweep_droplets.csv'), 'w') as f, \
+                ThreadPoolExecutor(workers) as pool:
+            f.write('Combination;Img_num;Droplet_number;R_med;Area;center_x;center_y\n')
+            for im in range(len(source)):
+                if frames is not None:
+                    img1 = frames[im]
+                else:
+                    img1 = cv2.cvtColor(cropFrame(source[im], cutTop, cutBottom),
+                                        cv2.COLOR_BGR2GRAY)
+                imgname = source.frameName(im)
+                img = stretchFrame(img1)
+                # the Laplacian image is computed once before the combinations run
+                pipeline.cache.clear()
+                pipeline.run(img, grid[0], imgname, stop='laplacian')
+
+                results = pool.map(lambda c: evaluateCombination(pipeline, img, imgname, cutTop,
+                                                                 c, precision, epsilon), grid)
+                for c, drop_array in enumerate(results):
+                    if len(drop_array) > 0:
+                        dropframes[c] += 1
+                    for d, drop in enumerate(drop_array):
+                        areas[c].append(drop.area)
+                        radii[c].append(drop.rMed)
+                        f.write('%d;%s;%d;%f;%f;%d;%d\n'%(c, imgname, d, drop.rMed, drop.area,
+                                                          drop.positionX, drop.positionY))
+                if im%50 == 0:
+                    print("Image: ", im)
+    pipeline.printTimings()
+
+    with open(outputfolder/(foldername+'_sweep.csv'), 'w') as f:
+        f.write('Combination;' + ';'.join(sweep_parameters.keys()) +
+                ';Droplets;Frames_with_droplets;Area_mean;Area_std;Area_median;R_med_mean;R_med_std\n')
+        for c, combination in enumerate(grid):
+            a = np.array(areas[c])
+            r = np.array(radii[c])
+            if len(a) > 0:
+                stats = (a.mean(), a.std(), np.median(a), r.mean(), r.std())
+            else:
+                stats = (np.nan,)*5
+            f.write('%d;'%c + ';'.join(str(v) for v in combination.values()) +
+                    ';%d;%d;%f;%f;%f;%f;%f\n'%((len(a), dropframes[c]) + stats))
+            print(combination, 'droplets:', len(a))
@@ -0,0 +1,477 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on October 19 2026
+
+License: BSD-3-Clause, see ./LICENSE or
+https://opensource.org/licenses/BSD-3-Clause for full details
+"""
+import os, json, time, socket, threading
+from contextlib import contextmanager
+from pathlib import Path
+from framesource import open_frame_source
+from fileprocess import crawlFolders
+from segmenter import DropletSegmenter
+from cropexport import mergeCrops
+from params import writeManifest
+from summary import jsonValue, summaryFromTables
+
+def createExclusive(filename, content=''):
+    '''
+    Create a file that must not exist yet. Exclusive creation is atomic also
+    on shared network filesystems, so only one worker can succeed.
+
+    Returns
+    -------
+    bool
+        True if the file was created by this call.
+
+    '''
+    try:
+        fd = os.open(str(filename), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    return True
+
+def writeAtomic(filename, content):
+    '''
+    Write a file under a temporary name and move it in place in one step.
+    '''
+    tmp = '%s.%s.%d.tmp'%(str(filename), socket.gethostname(), os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(content)
+    os.replace(tmp, str(filename))
+
+def publishExclusive(filename, content):
+    '''
+    Write a file that must not exist yet under a temporary name and link it
+    in place, so readers never see it partially written and only the first
+    of several writers succeeds.
+
+    Returns
+    -------
+    bool
+        True if the file was published by this call.
+
+    '''
+    tmp = '%s.%s.%d.tmp'%(str(filename), socket.gethostname(), os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(content)
+    try:
+        os.link(tmp, str(filename))
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp)
+
+def partName(foldername, start):
+    '''
+    Name of the output files of the frames from start on, when a folder is
+    split into frame ranges.
+    '''
+    return '%s.part%06d'%(foldername, start)
+
+
+class WorkQueue():
+    '''
+        Queue of segmentation tasks in a folder on a filesystem shared by all
+        workers. A task is a leaf folder of the experiment, or a range of its
+        frames. Workers claim tasks with lock files, keep their claims alive
+        with a heartbeat and reclaim the tasks of workers whose claim has not
+        been refreshed for stale seconds. A reclaim creates the next
+        generation of the lock file, so of several workers finding the same
+        stale claim only one takes the task over. Finished frame ranges are merged in
+        frame order, so the result does not depend on which worker did what.
+    '''
+
+    def __init__(self, parameters, worker=None):
+        '''
+        Initiate the class
+
+        Parameters
+        ----------
+        parameters : dictionary
+            The resolved run parameters, the input folder is the root of the
+            experiment and the results of every leaf folder are saved in the
+            same relative path in the output folder.
+        worker : string, optional
+            Name of the worker, by default host name and process id.
+
+        Returns
+        -------
+        None.
+
+        '''
+        if parameters['results index'] is not None:
+            # SQLite locking is not reliable on shared network filesystems
+            raise ValueError("'results index' can not be used with --worker, index the merged "
+                             "tables of the output folder after the run")
+        self.parameters = parameters
+        self.inputfolder = Path(parameters['inputfolder'])
+        self.outputfolder = Path(parameters['outputfolder'])
+        self.queuefolder = Path(parameters['queue'] or self.outputfolder/'.queue')
+        self.framesPerTask = parameters['frames per task']
+        self.stale = parameters['stale seconds']
+        self.heartbeat = max(self.stale/10, 1)
+        self.worker = worker or '%s-%d'%(socket.gethostname(), os.getpid())
+        self.segmenter = DropletSegmenter(parameters, verbose=False)
+        # the generation of the claim this worker holds of every task
+        self.claims = {}
+        for sub in ['claims', 'done', 'merged']:
+            (self.queuefolder/sub).mkdir(parents=True, exist_ok=True)
+        self.tasks = self.loadTasks()
+
+    def createTasks(self):
+        '''
+        The tasks of the experiment. Every task is a dictionary with the
+        folder, its output folder and name, the first and end frame and the
+        number of parts the folder is split into.
+        '''
+        if self.inputfolder.is_dir():
+            # the folders on the lowest level and their number of frames
+            folders = [(Path(entry['folder']), entry['images'])
+                       for entry in crawlFolders(self.inputfolder)]
+        else:
+            with open_frame_source(self.inputfolder) as source:
+                folders = [(self.inputfolder, len(source))]
+        tasks = []
+        for folder, n in folders:
+            name = folder.stem if folder.is_file() else folder.name
+            if n == 0:
+                print('No frames in %s'%str(folder))
+                continue
+            size = self.framesPerTask or n
+            starts = list(range(0, n, size))
+            for start in starts:
+                tasks.append({'folder': str(folder),
+                              'output': str(self.outputfolder/folder.relative_to(self.inputfolder)),
+                              'name': name,
+                              'start': start,
+                              'end': min(start + size, n),
+                              'parts': len(starts)})
+        return tasks
+
+    def loadTasks(self, poll=1):
+        '''
+        Read the task list, the worker holding the claim of 'tasks' creates
+        it. The claim is taken over like a task claim, if its worker crashes
+        before the list is written. Every worker uses the same list, also if
+        the folders change during the run.
+        '''
+        taskfile = self.queuefolder/'tasks.json'
+        while not taskfile.exists():
+            if not self.claim('tasks'):
+                time.sleep(poll)
+                continue
+            with self.keepingAlive('tasks'):
+                if not taskfile.exists():
+                    publishExclusive(taskfile, json.dumps(self.createTasks(), indent=1))
+            self.release('tasks')
+        with open(taskfile) as f:
+            return json.load(f)
+
+    def claimFile(self, name, generation):
+        return self.queuefolder/'claims'/('%s.gen%d'%(name, generation))
+
+    def doneFile(self, name):
+        return self.queuefolder/'done'/name
+
+    def lastGeneration(self, name):
+        '''
+        The newest generation of the claim of a task, -1 if it is not claimed.
+        '''
+        generation = -1
+        while self.claimFile(name, generation + 1).exists():
+            generation += 1
+        return generation
+
+    def claim(self, name):
+        '''
+        Try to claim a task, a stale claim of a crashed worker is taken over
+        by creating the next generation of the claim.
+
+        Returns
+        -------
+        bool
+            True if this worker owns the task now.
+
+        '''
+        generation = self.lastGeneration(name)
+        if generation >= 0:
+            try:
+                age = time.time() - self.claimFile(name, generation).stat().st_mtime
+            except FileNotFoundError:
+                # the claims are removed when the task is done
+                return False
+            if age < self.stale:
+                return False
+            print('Reclaiming %s from a stale claim'%name)
+        # only one worker can create the next generation
+        if not createExclusive(self.claimFile(name, generation + 1), self.worker):
+            return False
+        self.claims[name] = generation + 1
+        return True
+
+    def owns(self, name):
+        '''
+        Check that the newest claim of a task still belongs to this worker.
+        '''
+        return name in self.claims and self.lastGeneration(name) == self.claims[name]
+
+    def release(self, name):
+        '''
+        Remove all generations of the claim of a task, the newest first.
+        '''
+        for generation in range(self.lastGeneration(name), -1, -1):
+            try:
+                os.remove(str(self.claimFile(name, generation)))
+            except FileNotFoundError:
+                pass
+        self.claims.pop(name, None)
+
+    def keepAlive(self, name, stop):
+        '''
+        Refresh the claim of a task until stop is set.
+        '''
+        while not stop.wait(self.heartbeat):
+            try:
+                os.utime(str(self.claimFile(name, self.claims[name])))
+            except FileNotFoundError:
+                return
+
+    @contextmanager
+    def keepingAlive(self, name):
+        '''
+        Refresh the claim of a task in a heartbeat thread while the context
+        is open.
+        '''
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self.keepAlive, args=(name, stop), daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    def runTask(self, number):
+        '''
+        Segment the folder or frame range of a task.
+        '''
+        task = self.tasks[number]
+        name = None
+        frames = None
+        if task['parts'] > 1:
+            frames = (task['start'], task['end'])
+            name = partName(task['name'], task['start'])
+        with self.keepingAlive(self.taskName(number)):
+            self.segmenter.run(task['folder'], task['output'], frames, name)
+
+    def folderTasks(self, folder):
+        return [t for t, task in enumerate(self.tasks) if task['folder'] == folder]
+
+    def merge(self, folder, wait=False, poll=5):
+        '''
+        Merge the frame ranges of a folder, when all of them are done. The
+        merge is claimed like a task, so only one worker merges a folder and
+        a merge of a crashed worker is taken over.
+
+        Parameters
+        ----------
+        folder : string
+            The folder of the tasks.
+        wait : bool, optional
+            Wait until the folder is merged, also by another worker.
+        poll : float, optional
+            Seconds between the checks while waiting.
+
+        Returns
+        -------
+        None.
+
+        '''
+        tasks = sorted(self.folderTasks(folder), key=lambda t: self.tasks[t]['start'])
+        marker = self.queuefolder/'merged'/self.taskName(tasks[0])
+        if self.tasks[tasks[0]]['parts'] == 1:
+            return
+        name = 'merge' + self.taskName(tasks[0])
+        while not marker.exists():
+            if self.claim(name):
+                with self.keepingAlive(name):
+                    if not marker.exists():
+                        self.mergeParts(folder, tasks)
+                        createExclusive(marker, self.worker)
+                        # only removed when the merge is complete, a merge
+                        # that is taken over needs the parts
+                        self.removeParts(tasks)
+                self.release(name)
+            elif not wait:
+                return
+            else:
+                time.sleep(poll)
+
+    def mergeParts(self, folder, tasks):
+        '''
+        Merge the tables of the frame ranges of a folder in frame order into
+        the tables of the whole folder, and write the summary and manifest
+        of the whole folder.
+        '''
+        output = Path(self.tasks[tasks[0]]['output'])
+        foldername = self.tasks[tasks[0]]['name']
+        extension = self.segmenter.extension
+
+        for table in ['', '_frames', '_beads', '_crops']:
+            parts = self.partFiles(tasks, table + extension)
+            if not parts[0].exists():
+                continue
+            lines = []
+            for i, part in enumerate(parts):
+                with open(part) as f:
+                    content = f.readlines()
+                # the header is only kept once
+                lines += content if i == 0 else content[1:]
+            writeAtomic(output/(foldername + table + extension), ''.join(lines))
+        parts = self.partFiles(tasks, '_crops.npy')
+        if parts[0].exists():
+            mergeCrops(parts, output/(foldername + '_crops.npy'))
+        if self.segmenter.summary:
+            self.mergeSummary(output, foldername, self.partFiles(tasks, '_summary.json'))
+        if self.segmenter.manifest:
+            self.mergeManifest(folder, output, foldername, self.partFiles(tasks, '_manifest.json'))
+        print('Merged %d parts of %s'%(len(tasks), foldername))
+
+    def partFiles(self, tasks, suffix):
+        '''
+        The output files of the frame ranges of a folder with the suffix.
+        '''
+        output = Path(self.tasks[tasks[0]]['output'])
+        foldername = self.tasks[tasks[0]]['name']
+        return [output/(partName(foldername, self.tasks[t]['start']) + suffix) for t in tasks]
+
+    def removeParts(self, tasks):
+        '''
+        Remove the output files of the frame ranges of a merged folder.
+        '''
+        extension = self.segmenter.extension
+        suffixes = ([table + extension for table in ['', '_frames', '_beads', '_crops']] +
+                    ['_crops.npy', '_summary.json', '_manifest.json'])
+        for suffix in suffixes:
+            for filename in self.partFiles(tasks, suffix):
+                try:
+                    os.remove(str(filename))
+                except FileNotFoundError:
+                    pass
+
+    def taskName(self, task):
+        return '%06d'%task
+
+    def mergeSummary(self, output, foldername, parts):
+        '''
+        Summary of a merged folder from its merged tables, the seconds are
+        the sum over the parts.
+        '''
+        seconds = 0
+        for part in parts:
+            with open(part) as f:
+                seconds += json.load(f)['seconds']
+        extension = self.segmenter.extension
+        summary = summaryFromTables(output/(foldername + '_summary.json'),
+                                    output/(foldername + extension),
+                                    output/(foldername + '_frames' + extension),
+                                    self.segmenter.dropMin, self.segmenter.dropMax,
+                                    seconds, self.segmenter.separator)
+        writeAtomic(summary.filename, json.dumps(jsonValue(summary.toDict(final=True)), indent=1))
+
+    def mergeManifest(self, folder, output, foldername, parts):
+        '''
+        Manifest of a merged folder, the inputs of the whole folder are
+        hashed once and the timing is the sum over the parts.
+        '''
+        timing = {'background_seconds': 0, 'segmentation_seconds': 0, 'total_seconds': 0,
+                  'skipped_frames': 0, 'stages': {}}
+        for part in parts:
+            with open(part) as f:
+                partTiming = json.load(f)['timing']
+            for key in ['background_seconds', 'segmentation_seconds', 'total_seconds',
+                        'skipped_frames']:
+                timing[key] += partTiming[key]
+            timing['workers'] = partTiming['workers']
+            for name, stage in partTiming['stages'].items():
+                total = timing['stages'].setdefault(name, {'seconds': 0, 'calls': 0})
+                total['seconds'] += stage['seconds']
+                total['calls'] += stage['calls']
+        timing['parts'] = len(parts)
+        with open_frame_source(folder) as source:
+            timing['frames_per_second'] = len(source)/max(timing['segmentation_seconds'], 1e-9)
+            writeManifest(output/(foldername + '_manifest.json'), self.parameters, source,
+                          timing, timing['workers'], self.segmenter.hashInputs)
+
+    def isDone(self, task):
+        return self.doneFile(self.taskName(task)).exists()
+
+    def work(self, poll=5):
+        '''
+        Claim and run tasks until all tasks are done, then merge the frame
+        ranges of all folders.
+
+        Parameters
+        ----------
+        poll : float, optional
+            Seconds to wait before looking for stale claims again, when all
+            open tasks are claimed by other workers.
+
+        Returns
+        -------
+        n_tasks : integer
+            The number of tasks run by this worker.
+
+        '''
+        n_tasks = 0
+        while True:
+            open_tasks = [t for t in range(len(self.tasks)) if not self.isDone(t)]
+            if len(open_tasks) == 0:
+                break
+            ran = False
+            for task in open_tasks:
+                name = self.taskName(task)
+                if self.isDone(task) or not self.claim(name):
+                    continue
+                if self.isDone(task):
+                    self.release(name)
+                    continue
+                print('Worker %s runs task %d of %d'%(self.worker, task + 1, len(self.tasks)))
+                self.runTask(task)
+                n_tasks += 1
+                ran = True
+                # a worker that lost its claim leaves the task to the new owner
+                if self.owns(name):
+                    createExclusive(self.doneFile(name), self.worker)
+                    self.release(name)
+                else:
+                    self.claims.pop(name, None)
+                folder = self.tasks[task]['folder']
+                if all(self.isDone(t) for t in self.folderTasks(folder)):
+                    self.merge(folder)
+            if not ran:
+                time.sleep(poll)
+        # folders whose last part was finished or merged by a crashed worker
+        for folder in sorted(set(task['folder'] for task in self.tasks)):
+            self.merge(folder, wait=True, poll=poll)
+        return n_tasks
+
+
+def work(parameters):
+    '''
+    Run a worker of the distributed mode.
+    '''
+    try:
+        queue = WorkQueue(parameters)
+    except ValueError as e:
+        print(e)
+        return
+    print('Worker %s, %d tasks in %s'%(queue.worker, len(queue.tasks), str(queue.queuefolder)))
+    n_tasks = queue.work()
+    print('Worker %s finished after %d tasks'%(queue.worker, n_tasks))